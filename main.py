@@ -1,24 +1,34 @@
 # main.py
+import time
+_IMPORT_START = time.perf_counter() # Start of the "import" phase of the startup report
 import json
+import copy
+import queue
+import threading
 import cv2
 import pathlib
+import argparse
 from os.path import join, dirname
 import os
+from util.io import open_input_stream, get_unique_output_path, export_config, FrameRingBuffer
 from pipeline.registry import create_step
-import pipeline.filters
-import pipeline.layer
-from util.io import open_input_stream, get_unique_output_path, export_config
-from pipeline.registry import create_step
-from util.profiler import PipelineProfiler
+import pipeline.registry
+from pipeline.plan import PipelinePlan
+from util.profiler import PipelineProfiler, StartupReport
+from util.writer import OutputWriter
+from util.recorder import VideoRecorder, FrameStackRecorder
+from util.governor import FrameGovernor
 from util.message_handler import MessageManager
 from tools.viewport_tool import Viewport, ViewportAnimator
-from tools.obs_controller import OBSController
+# Step modules are imported by the registry when a config names one of their steps,
+# tkinter (config export) and obswebsocket (record_mode "obs") on first use.
 
 
 def load_pipeline(global_config, pipe_config, verbose=True):
-    print(f"=====\nGlobal Config:")
-    for k in global_config:
-        print(f"[{k.center(20)}]: {global_config[k]}")
+    if verbose:
+        print(f"=====\nGlobal Config:")
+        for k in global_config:
+            print(f"[{k.center(20)}]: {global_config[k]}")
     if verbose: print("=====\nLoading Pipeline...")
     if pipe_config.get("load_from_file"):
         with open(pipe_config["pipe"], "r") as f:
@@ -33,24 +43,38 @@ def load_pipeline(global_config, pipe_config, verbose=True):
         print("=====\n")
     return steps
 
-def run_pipeline(config_path):
-    import json
-    import cv2
-    from util.io import open_input_stream
-    from pipeline.registry import create_step
+def run_pipeline(config_path, startup_report=False):
+    # Time to first frame by phase, printed with startup_report (or "startup_report" in the config)
+    startup = StartupReport(_IMPORT_START)
+    startup.mark("import")
 
     # Load Config File
     with open(config_path, "r") as f:
         config = json.load(f)
     cfg = config["config"]
+    startup.mark("config parse")
+    discovery_time = pipeline.registry.discovery_time
     steps = load_pipeline(cfg, config["pipe_config"])
+    startup.mark("step construction")
+    startup.move(pipeline.registry.discovery_time - discovery_time, "step construction", "import")
+    # Consecutive point operations are fused into one LUT pass, "debug_steps" keeps per-step timings
+    # "processing_scale" < 1 runs the chain on a downscaled copy of the viewport and upscales once at the end
+    # "negotiate_formats" passes single channel frames between steps that take them (fewer cvtColor round trips)
+    plan = PipelinePlan(steps, fuse=cfg.get("fuse_point_ops", True), debug=cfg.get("debug_steps", False),
+                        use_arena=cfg.get("buffer_arena", True), verbose=True,
+                        processing_scale=cfg.get("processing_scale", 1.0),
+                        cache=cfg["input_type"] == "image" and cfg.get("cache_steps", True),
+                        cache_budget_mb=cfg.get("cache_budget_mb", 256),
+                        negotiate=cfg.get("negotiate_formats", True))
     selected_step = 0
     selected_param = 0
     current_param_multiplier = 0
     param_multipliers = [1,5,10,100]
 
     # Open Input Stream
-    stream = open_input_stream(cfg["input_root"],cfg["input_type"], cfg["input_source"], cfg.get("framerate", 0))
+    stream = open_input_stream(cfg["input_root"],cfg["input_type"], cfg["input_source"], cfg.get("framerate", 0),
+                               threaded=cfg.get("threaded_capture", False), buffer_size=cfg.get("capture_buffer", 4),
+                               drop_late=cfg.get("drop_late_frames", True), sequence=cfg.get("sequence"))
     if cfg.get("visualize", False):
         window_name = cfg.get("window_name","Window")
         cv2.namedWindow(window_name) # WINDOW_NORMAL allows resizing
@@ -59,14 +83,36 @@ def run_pipeline(config_path):
         cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
 
     # Setup frame/process timer
-    profiler = PipelineProfiler(window_size=30, print_interval=100,desired_framerate=cfg.get("framerate", 0))
+    # "profile_trace": path of a Chrome trace-event JSON written on exit
+    profiler = PipelineProfiler(window_size=cfg.get("profile_window", 30), print_interval=100,desired_framerate=cfg.get("framerate", 0),
+                                trace=bool(cfg.get("profile_trace")))
+
+    # Optional frame-budget governor, trades quality of steps marked "optional"/"min_ksize" for framerate
+    governor = None
+    if cfg.get("governor", False) and cfg.get("framerate", 0):
+        governor = FrameGovernor(plan, profiler, cfg["framerate"], patience=cfg.get("governor_patience", 2),
+                                 min_scale=cfg.get("governor_min_scale"))
+
+    # Setup background writer for step outputs and screenshots
+    writer = OutputWriter(workers=cfg.get("writer_threads", 2), max_queue=cfg.get("writer_queue", 32),
+                          policy=cfg.get("writer_policy", "block"), profiler=profiler)
 
     # Setup text message handler
     msg = MessageManager()
     msg.add_message("status", "Startup successful...", duration=30, color=(0,255,0), size=1, position=(100,100))
 
-    # Setup OBS Websocket controller (for recording video)
-    obs = OBSController(password="visionpipe")
+    # Setup video recording, "native" encodes the processed frames itself, "obs" toggles OBS over its websocket,
+    # "frame_stack" dumps the raw input frames to a .npy for replay with the "frame_stack" input type
+    record_mode = cfg.get("record_mode", "native")
+    if record_mode == "frame_stack":
+        recorder = FrameStackRecorder(max_queue=cfg.get("record_queue", 64), policy=cfg.get("record_policy", "block"), profiler=profiler)
+    else:
+        recorder = VideoRecorder(codec=cfg.get("record_codec", "mp4v"), fps=cfg.get("record_fps", cfg.get("framerate", 0) or 30),
+                                 max_queue=cfg.get("record_queue", 64), policy=cfg.get("record_policy", "drop"), profiler=profiler)
+    obs = None
+    if record_mode == "obs":
+        from tools.obs_controller import OBSController
+        obs = OBSController(password="visionpipe")
 
     # Get initial frame
     while stream.is_open():
@@ -80,38 +126,203 @@ def run_pipeline(config_path):
     vp = Viewport(frame,w//2,h//2,w,h)
     vp.debug = False
     vp.update()
+    # Infer shapes, resolve step constants and size buffers before the first frame
+    plan.compile(vp.view.shape, vp.view.dtype)
+    print(f"=====\nPipeline Plan:\n{plan.describe()}\n=====")
     vp_animator = ViewportAnimator()
     vp_animator.update()
 
-    cv_delay = 0 if cfg["input_type"] == "image" else 1
+    # Processing runs on its own thread and hands finished frames to the display (main) thread,
+    # key presses come back as commands that are applied between frames.
+    visualize = cfg.get("visualize", False)
+    # A static image is only reprocessed after a command (the old waitKey(0) behaviour)
+    wait_for_commands = cfg["input_type"] == "image" and visualize
     save_frameset, save_screenshot = (False, False)
-    while stream.is_open():
+    frame_key = None
+    stop = threading.Event()
+    commands = queue.Queue()
+    exports = queue.Queue() # Config snapshots taken between frames, saved from the main thread
+    latest = FrameRingBuffer(1, "latest") # Newest finished frame, older ones are never shown
+
+    def handle_key(key):
+        nonlocal selected_step, selected_param, current_param_multiplier, save_frameset, save_screenshot
+        # ==== SAVE OUTPUTS ====
+        if key == ord("x"): # Save frameset
+            msg.add_message("status","Saving frameset...")
+            save_frameset = True
+        elif key == ord("z"): # Save screenshot
+            msg.add_message("status","Saving screenshot...")
+            save_screenshot = True   
+        elif key == ord("n"): # Save current config
+            pipe_cfg = {"load_from_file": False, "pipe":[step.to_dict() for step in steps]}
+            exports.put(copy.deepcopy({"config":cfg,"pipe_config":pipe_cfg}))
+        elif key == ord("m"): # Start/Stop Recording Video
+            if obs is not None:
+                obs.toggle_recording()
+                # print(obs.get_recording_status())
+            else:
+                label = cfg.get("record_label", cfg["screenshot_label"])
+                record_format = "npy" if record_mode == "frame_stack" else cfg.get("record_format", "mp4")
+                out_path = get_unique_output_path(join(cfg["output_root"],f"recordings/{label}.{record_format}"))
+                if recorder.toggle(out_path):
+                    msg.add_message("status","Recording started...")
+                else:
+                    msg.add_message("status",f"Recording saved: {recorder.stats()['written']} frames")
+        # ==== CONFIGURE PIPELINE ====
+        elif key == ord("1"): # Select previous step
+            if len(steps) > 0: 
+                # Select previous step
+                selected_step = (selected_step - 1) % len(steps)
+                step_name = steps[selected_step].__class__.__name__
+                msg.add_message("status",f"[Step {selected_step+1}/{len(steps)}] {step_name}")
+                # Select initial parameter
+                selected_param = 0 if len(steps[selected_step].params.keys()) > 0 else None
+                if selected_param is not None:
+                    param_name, param_val = list(steps[selected_step].params.items())[selected_param]
+                    msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
+                else:
+                    msg.add_message("config",f"[0 Params]",position=(10,100))
+        elif key == ord("2"): # Select next step
+            if len(steps) > 0: 
+                # Select next step
+                selected_step = (selected_step + 1) % len(steps)
+                step_name = steps[selected_step].__class__.__name__
+                msg.add_message("status",f"[Step {selected_step+1}/{len(steps)}] {step_name}")
+                # Select initial parameter
+                selected_param = 0 if len(steps[selected_step].params.keys()) > 0 else None
+                if selected_param is not None:
+                    param_name, param_val = list(steps[selected_step].params.items())[selected_param]
+                    msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
+                else:
+                    msg.add_message("config",f"[0 Params]",position=(10,100))
+        elif key == ord("3"): # Select previous parameter
+            total_params = len(steps[selected_step].params.keys())
+            if total_params > 0:
+                selected_param = (selected_param - 1) % total_params
+                param_name, param_val = list(steps[selected_step].params.items())[selected_param]
+                msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
+            else:
+                msg.add_message("config",f"[0 Params]",position=(10,100))
+        elif key == ord("4"): # Select next parameter
+            total_params = len(steps[selected_step].params.keys())
+            if total_params > 0:
+                selected_param = (selected_param + 1) % total_params
+                param_name, param_val = list(steps[selected_step].params.items())[selected_param]
+                msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
+            else:
+                msg.add_message("config",f"[0 Params]",position=(10,100))
+        elif key == ord("5"): # Decrease selected parameter
+            if selected_param is not None:
+                param_name, param_val = list(steps[selected_step].params.items())[selected_param]
+                steps[selected_step].edit_parameter(param_name,"down",param_multipliers[current_param_multiplier])
+                msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
+        elif key == ord("6"): # Increase selected parameter
+            if selected_param is not None:
+                param_name, param_val = list(steps[selected_step].params.items())[selected_param]
+                steps[selected_step].edit_parameter(param_name,"up",param_multipliers[current_param_multiplier])
+                msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
+        elif key == ord("7"): # Cycle through param multipliers
+            current_param_multiplier = (current_param_multiplier + 1) % len(param_multipliers)
+            msg.add_message("config",f"[Param Multiplier]: {param_multipliers[current_param_multiplier]}",position=(10,100))
+        elif key == ord("8"): # Move step BACKWARD in list
+            if selected_step > 0:
+                temp = steps[selected_step-1]
+                steps[selected_step-1] = steps[selected_step]
+                steps[selected_step] = temp
+                selected_step = selected_step - 1
+                step_name = steps[selected_step].__class__.__name__
+                msg.add_message("status",f"[Step {selected_step+1}/{len(steps)}] {step_name}")
+        elif key == ord("9"): # Move step FORWARD in list
+            if selected_step < len(steps)-1:
+                temp = steps[selected_step+1]
+                steps[selected_step+1] = steps[selected_step]
+                steps[selected_step] = temp
+                selected_step = selected_step + 1
+                step_name = steps[selected_step].__class__.__name__
+                msg.add_message("status",f"[Step {selected_step+1}/{len(steps)}] {step_name}")
+        elif key == ord("`"): # Toggle step "enabled" param
+            if len(steps) > 0:
+                step_name = steps[selected_step].__class__.__name__
+                steps[selected_step].set_param("enabled", not steps[selected_step].params.get("enabled",True))
+                step_enabled = steps[selected_step].params["enabled"]
+                msg.add_message("config",f"{step_name} enabled: {step_enabled}",position=(50,100))
+        # ==== VIEWPORT CONTROLS ====
+        elif key == ord("w"): # Viewport Up
+            vp.move("up",param_multipliers[current_param_multiplier],vp_mode)
+            print("[VP] Up")
+        elif key == ord("a"): # Viewport Left
+            vp.move("left",param_multipliers[current_param_multiplier],vp_mode)
+            print("[VP] Left")
+        elif key == ord("s"): # Viewport Down
+            vp.move("down",param_multipliers[current_param_multiplier],vp_mode)
+            print("[VP] Down")
+        elif key == ord("d"): # Viewport Right
+            vp.move("right",param_multipliers[current_param_multiplier],vp_mode)
+            print("[VP] Right")
+        elif key == ord("r"): # Viewport Zoom In
+            vp.h = int(max(vp.h * 0.9,10))
+            vp.w = int(max(vp.w * 0.9,10))
+            print("[VP] Zoom In: ",vp.w,vp.h)
+        elif key == ord("e"): # Viewport Zoom Out
+            vp.h = int(min(vp.h * 1.1,h))
+            vp.w = int(min(vp.w * 1.1,w))
+            print("[VP] Zoom Out: ",vp.w,vp.h)
+        elif key == ord("f"): # Viewport Rotate Left
+            vp.a = (vp.a + 15) % 360
+            print("[VP] Rotate Left: ",vp.a)
+        elif key == ord("c"): # Viewport Rotate Right
+            vp.a = (vp.a - 15) % 360
+            print("[VP] Rotate Right: ",vp.a)
+        elif key == ord('t'): # Viewport Reset
+            vp.reset()
+        elif key == ord('o'): # Viewport Animator - Add state
+            vp_animator.add_state(vp.get_state(),steps=75)
+        elif key == ord('p'): # Viewport Animator - Play/Pause
+            vp_animator.playpause()
+        elif key == ord('l'):# Viewport Animator - Reset
+            vp_animator.reset()
+            print("7. Animator reset")
+
+    def process_frame():
+        nonlocal save_frameset, save_screenshot, frame_key
         profiler.start_frame()
         # Get next frame
         frame = stream.read()
         if frame is None:
-            break
+            return None
+        if record_mode == "frame_stack":
+            recorder.submit(frame)
         
         vp_animator.update()
         if vp_animator.playing:
             vp.set_state(vp_animator.current_state)
-        vp.image = frame
-        vp.update()
-        frame = vp.view
+        if plan.cache:
+            # Same source image and viewport: the viewport and the cached step outputs are still valid
+            new_key = (id(frame), tuple(vp.get_state()))
+            if new_key != frame_key:
+                frame_key = new_key
+                vp.image = frame
+                vp.update()
+            frame = vp.view
+        else:
+            vp.image = frame
+            vp.update()
+            frame = vp.view
+            if vp.path != "warp" and cfg["input_type"] == "image":
+                # Zero copy view of the reused source image, steps may draw on the frame in place
+                # (read-only frame stack views are only copied by the plan, in front of such a step)
+                frame = frame.copy()
 
         # Apply all pipeline steps
-        for step in steps:
-            if not step.params.get("enabled",True):
-                continue
-            #Start step timer
-            profiler.start_step(step.__class__.__name__)
-
-            frame = step.apply(frame)
+        on_step = None
+        if cfg["input_type"] == "image" or save_frameset == True:
             # Will only save if "output_file" is changed from default for that step
-            if cfg["input_type"] == "image" or save_frameset == True:
-                step.save_output(cfg["output_root"],frame,cfg["numbered_files"])
-            # End step timer
-            profiler.end_step()
+            on_step = lambda step, out: step.save_output(cfg["output_root"],out,cfg["numbered_files"],writer)
+            if save_frameset and plan.cache:
+                plan.invalidate() # Run (and save) every step
+        frame = plan.run(frame, profiler, on_step, frame_key)
+        if plan.arena is not None:
+            profiler.record("Arena allocs", plan.arena.frame_allocations)
         save_frameset = False
         
 
@@ -119,178 +330,142 @@ def run_pipeline(config_path):
         if save_screenshot:
             # write numbered frame
             out_path = get_unique_output_path(join(cfg["output_root"],f"screenshots/{cfg['screenshot_label']}.png"))
-            os.makedirs(dirname(out_path), exist_ok=True)
-            ss_frame = frame.copy()
+            ss_frame = frame
             if cfg["screenshot_rotations"] != 0:
                 rotate = cv2.ROTATE_90_COUNTERCLOCKWISE
                 if cfg["screenshot_rotations"]%4 == 1: rotate = cv2.ROTATE_90_CLOCKWISE
                 elif cfg["screenshot_rotations"]%4 == 2: rotate = cv2.ROTATE_180
                 print(f"SS: {cfg['screenshot_rotations']} -- {rotate}")
                 ss_frame = cv2.rotate(ss_frame,rotate)
-            cv2.imwrite(out_path,ss_frame)
+            writer.submit(out_path,ss_frame,copy=ss_frame is frame) # cv2.rotate already made a copy
             save_screenshot = False
 
+        # Record the processed frame before GUI messages are drawn on it
+        if record_mode != "frame_stack":
+            recorder.submit(frame)
 
         #TODO: resize final frame, implement different resize modes
-        #TODO: Implement average framerate tracker/warning
 
         # End frame timer
         profiler.end_frame()
+        if governor is not None:
+            governor.update()
+        return frame
+
+    def apply_commands(block):
+        # Only called between frames, so a step never sees a param change halfway through a frame
+        try:
+            handle_key(commands.get(timeout=0.1) if block else commands.get_nowait())
+        except queue.Empty:
+            return False
+        while not commands.empty():
+            handle_key(commands.get_nowait())
+        return True
 
-        if cfg.get("visualize", False):
-            # Draw GUI messages
-            msg.draw(frame)
-            # Show frame
-            cv2.imshow(window_name, frame)
+    errors = []
+
+    def process_loop():
+        try:
+            processed = False
+            while stream.is_open() and not stop.is_set():
+                if wait_for_commands and processed:
+                    if not apply_commands(block=True):
+                        continue
+                else:
+                    apply_commands(block=False)
+                frame = process_frame()
+                if frame is None:
+                    break
+                if not processed and (startup_report or cfg.get("startup_report", False)):
+                    startup.mark("first frame")
+                    # Layer images etc. are decoded lazily while the first frame runs
+                    startup.move(sum(step.asset_time for step in steps), "first frame", "asset load")
+                    startup.print()
+                processed = True
+                if visualize:
+                    # The plan's output buffers are reused by the next frame
+                    latest.put(frame.copy())
+        except Exception as e:
+            # e.g. a layer image that only turns out corrupt when decoded, re-raised after shutdown
+            print(f"[Error] Pipeline stopped: {e}")
+            errors.append(e)
+        finally:
+            stop.set()
+            latest.close()
+
+    def fit_display(frame):
+        # Downscale for display only, to "display_size" [w, h] or the window ("display_fit_window")
+        size = cfg.get("display_size")
+        if cfg.get("display_fit_window", False):
+            try:
+                _, _, win_w, win_h = cv2.getWindowImageRect(window_name)
+                if win_w > 0 and win_h > 0:
+                    size = (win_w, win_h)
+            except cv2.error:
+                pass
+        if size and (frame.shape[1] > size[0] or frame.shape[0] > size[1]):
+            s = min(size[0] / frame.shape[1], size[1] / frame.shape[0])
+            frame = cv2.resize(frame, (max(1, int(frame.shape[1] * s)), max(1, int(frame.shape[0] * s))), interpolation=cv2.INTER_AREA)
+        return frame
+
+    if not visualize:
+        process_loop()
+    else:
+        worker = threading.Thread(target=process_loop, name="pipeline", daemon=True)
+        worker.start()
+        display_interval = 1.0 / cfg["display_fps"] if cfg.get("display_fps") else 0
+        while not stop.is_set():
+            shown_at = time.perf_counter()
+            frame = latest.get(timeout=0.05)
+            if frame is not None:
+                frame = fit_display(frame)
+                # Draw GUI messages
+                msg.draw(frame)
+                # Show frame
+                cv2.imshow(window_name, frame)
 
             # Handle GUI Controls
-            key = cv2.waitKey(cv_delay) & 0xFF
+            key = cv2.waitKey(1) & 0xFF
             if key != 255: print(f"[{chr(key).center(3)} / {key}] pressed: ", end="")
             # ==== QUIT ====
             if key == ord("q"):
                 print ("Quitting...")
                 break
-            # ==== SAVE OUTPUTS ====
-            elif key == ord("x"): # Save frameset
-                msg.add_message("status","Saving frameset...")
-                save_frameset = True
-            elif key == ord("z"): # Save screenshot
-                msg.add_message("status","Saving screenshot...")
-                save_screenshot = True   
-            elif key == ord("m"): # Start/Stop Recording Video
-                obs.toggle_recording()
-                # print(obs.get_recording_status())
-            elif key == ord("n"): # Save current config
-                pipe_cfg = {"load_from_file": False, "pipe":[step.to_dict() for step in steps]}
-                out_cfg = {"config":cfg,"pipe_config":pipe_cfg}
-                export_config(out_cfg,config_path)
-            # ==== CONFIGURE PIPELINE ====
-            elif key == ord("1"): # Select previous step
-                if len(steps) > 0: 
-                    # Select previous step
-                    selected_step = (selected_step - 1) % len(steps)
-                    step_name = steps[selected_step].__class__.__name__
-                    msg.add_message("status",f"[Step {selected_step+1}/{len(steps)}] {step_name}")
-                    # Select initial parameter
-                    selected_param = 0 if len(steps[selected_step].params.keys()) > 0 else None
-                    if selected_param is not None:
-                        param_name, param_val = list(steps[selected_step].params.items())[selected_param]
-                        msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
-                    else:
-                        msg.add_message("config",f"[0 Params]",position=(10,100))
-            elif key == ord("2"): # Select next step
-                if len(steps) > 0: 
-                    # Select next step
-                    selected_step = (selected_step + 1) % len(steps)
-                    step_name = steps[selected_step].__class__.__name__
-                    msg.add_message("status",f"[Step {selected_step+1}/{len(steps)}] {step_name}")
-                    # Select initial parameter
-                    selected_param = 0 if len(steps[selected_step].params.keys()) > 0 else None
-                    if selected_param is not None:
-                        param_name, param_val = list(steps[selected_step].params.items())[selected_param]
-                        msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
-                    else:
-                        msg.add_message("config",f"[0 Params]",position=(10,100))
-            elif key == ord("3"): # Select previous parameter
-                total_params = len(steps[selected_step].params.keys())
-                if total_params > 0:
-                    selected_param = (selected_param - 1) % total_params
-                    param_name, param_val = list(steps[selected_step].params.items())[selected_param]
-                    msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
-                else:
-                    msg.add_message("config",f"[0 Params]",position=(10,100))
-            elif key == ord("4"): # Select next parameter
-                total_params = len(steps[selected_step].params.keys())
-                if total_params > 0:
-                    selected_param = (selected_param + 1) % total_params
-                    param_name, param_val = list(steps[selected_step].params.items())[selected_param]
-                    msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
-                else:
-                    msg.add_message("config",f"[0 Params]",position=(10,100))
-            elif key == ord("5"): # Decrease selected parameter
-                if selected_param is not None:
-                    param_name, param_val = list(steps[selected_step].params.items())[selected_param]
-                    steps[selected_step].edit_parameter(param_name,"down",param_multipliers[current_param_multiplier])
-                    msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
-            elif key == ord("6"): # Increase selected parameter
-                if selected_param is not None:
-                    param_name, param_val = list(steps[selected_step].params.items())[selected_param]
-                    steps[selected_step].edit_parameter(param_name,"up",param_multipliers[current_param_multiplier])
-                    msg.add_message("config",f"[Param {selected_param+1}/{len(steps[selected_step].params.keys())}] {param_name} = {param_val}",position=(10,100))
-            elif key == ord("7"): # Cycle through param multipliers
-                current_param_multiplier = (current_param_multiplier + 1) % len(param_multipliers)
-                msg.add_message("config",f"[Param Multiplier]: {param_multipliers[current_param_multiplier]}",position=(10,100))
-            elif key == ord("8"): # Move step BACKWARD in list
-                if selected_step > 0:
-                    temp = steps[selected_step-1]
-                    steps[selected_step-1] = steps[selected_step]
-                    steps[selected_step] = temp
-                    selected_step = selected_step - 1
-                    step_name = steps[selected_step].__class__.__name__
-                    msg.add_message("status",f"[Step {selected_step+1}/{len(steps)}] {step_name}")
-            elif key == ord("9"): # Move step FORWARD in list
-                if selected_step < len(steps)-1:
-                    temp = steps[selected_step+1]
-                    steps[selected_step+1] = steps[selected_step]
-                    steps[selected_step] = temp
-                    selected_step = selected_step + 1
-                    step_name = steps[selected_step].__class__.__name__
-                    msg.add_message("status",f"[Step {selected_step+1}/{len(steps)}] {step_name}")
-            elif key == ord("`"): # Toggle step "enabled" param
-                if len(steps) > 0:
-                    step_name = steps[selected_step].__class__.__name__
-                    steps[selected_step].params["enabled"] = not steps[selected_step].params.get("enabled",True)
-                    step_enabled = steps[selected_step].params["enabled"]
-                    msg.add_message("config",f"{step_name} enabled: {step_enabled}",position=(50,100))
-            # ==== VIEWPORT CONTROLS ====
-            elif key == ord("w"): # Viewport Up
-                vp.move("up",param_multipliers[current_param_multiplier],vp_mode)
-                print("[VP] Up")
-            elif key == ord("a"): # Viewport Left
-                vp.move("left",param_multipliers[current_param_multiplier],vp_mode)
-                print("[VP] Left")
-            elif key == ord("s"): # Viewport Down
-                vp.move("down",param_multipliers[current_param_multiplier],vp_mode)
-                print("[VP] Down")
-            elif key == ord("d"): # Viewport Right
-                vp.move("right",param_multipliers[current_param_multiplier],vp_mode)
-                print("[VP] Right")
-            elif key == ord("r"): # Viewport Zoom In
-                vp.h = int(max(vp.h * 0.9,10))
-                vp.w = int(max(vp.w * 0.9,10))
-                print("[VP] Zoom In: ",vp.w,vp.h)
-            elif key == ord("e"): # Viewport Zoom Out
-                vp.h = int(min(vp.h * 1.1,h))
-                vp.w = int(min(vp.w * 1.1,w))
-                print("[VP] Zoom Out: ",vp.w,vp.h)
-            elif key == ord("f"): # Viewport Rotate Left
-                vp.a = (vp.a + 15) % 360
-                print("[VP] Rotate Left: ",vp.a)
-            elif key == ord("c"): # Viewport Rotate Right
-                vp.a = (vp.a - 15) % 360
-                print("[VP] Rotate Right: ",vp.a)
-            elif key == ord('t'): # Viewport Reset
-                vp.reset()
-            elif key == ord('o'): # Viewport Animator - Add state
-                vp_animator.add_state(vp.get_state(),steps=75)
-            elif key == ord('p'): # Viewport Animator - Play/Pause
-                vp_animator.playpause()
-            elif key == ord('l'):# Viewport Animator - Reset
-                vp_animator.reset()
-                print("7. Animator reset")
-
+            elif key != 255:
+                commands.put(key)
+            # Save config ("n"), the file dialog stays on the main thread
+            try:
+                export_config(exports.get_nowait(),config_path)
+            except queue.Empty:
+                pass
+            if display_interval:
+                time.sleep(max(0.0, display_interval - (time.perf_counter() - shown_at)))
+        stop.set()
+        worker.join()
+        print(f"[Display] {latest.stats()}")
 
-        #TODO: export config file
 
     stream.release()
+    recorder.stop()
+    writer.close()
+    if profiler.trace:
+        profiler.export_trace(cfg["profile_trace"])
+    if stream.stats():
+        print(f"[Capture] {stream.stats()}")
     cv2.destroyAllWindows()
+    if errors:
+        raise errors[0]
     print("\nProgram finished.\n")
 
 if __name__ == "__main__":
     root_directory = pathlib.Path(__file__).parent.resolve()
-    config_file = root_directory / "configs" / "dev_live_config_new.json"
+    parser = argparse.ArgumentParser(description="Run a pipeline config")
+    parser.add_argument("config", nargs="?", default=str(root_directory / "configs" / "dev_live_config_new.json"))
+    parser.add_argument("--startup-report", action="store_true", help="Print time to first frame by phase")
+    args = parser.parse_args()
+    config_file = pathlib.Path(args.config)
     if config_file.resolve().exists():
         print(f"=====\nRunning Config: {config_file}")
-        run_pipeline(config_file)
+        run_pipeline(config_file, args.startup_report)
     else:
         print(f"Config path ( {config_file} ) not found")
\ No newline at end of file
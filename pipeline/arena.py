@@ -0,0 +1,57 @@
+# pipeline/arena.py
+import numpy as np
+
+class BufferArena:
+    """
+    Per-pipeline pool of frame buffers, recycled across frames.
+
+    Every buffer belongs to an owner (a step) and a name ("out", "gray", ...). A request
+    with the same shape and dtype as last frame returns the same array, so a pipeline
+    running at a fixed resolution stops allocating after its first frame. A buffer stays
+    untouched until its owner runs again, so a step output is valid until the next frame.
+    """
+    def __init__(self):
+        self._buffers = {}  # (id(owner), name) -> np.ndarray
+        self.allocations = 0
+        self.hits = 0
+        self.frame_allocations = 0
+
+    def begin_frame(self):
+        self.frame_allocations = 0
+
+    def get(self, owner, name, shape, dtype=np.uint8):
+        key = (id(owner), name)
+        buf = self._buffers.get(key)
+        shape = tuple(shape)
+        if buf is not None and buf.shape == shape and buf.dtype == dtype:
+            self.hits += 1
+            return buf
+        buf = np.empty(shape, dtype=dtype)
+        self._buffers[key] = buf
+        self.allocations += 1
+        self.frame_allocations += 1
+        return buf
+
+    def peek(self, owner, name):
+        """ The buffer currently held for owner and name, or None, without allocating. """
+        return self._buffers.get((id(owner), name))
+
+    def release(self, owner, name):
+        """ Drop a single buffer, the next get() for it allocates again. """
+        self._buffers.pop((id(owner), name), None)
+
+    def prune(self, owners):
+        """ Release the buffers of every owner not in owners. """
+        keep = {id(owner) for owner in owners}
+        for key in [key for key in self._buffers if key[0] not in keep]:
+            del self._buffers[key]
+
+    def clear(self):
+        self._buffers.clear()
+
+    def stats(self):
+        return {"buffers": len(self._buffers),
+                "bytes": sum(buf.nbytes for buf in self._buffers.values()),
+                "allocations": self.allocations,
+                "hits": self.hits,
+                "frame_allocations": self.frame_allocations}
@@ -0,0 +1,59 @@
+# pipeline/bands.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Index of the band the current thread is processing, PipelineStep.buffer() uses it to
+# give every band its own scratch buffers
+band_local = threading.local()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def band_pool():
+    """ Thread pool shared by all banded steps (OpenCV releases the GIL while it works). """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="band")
+        return _pool
+
+def band_bounds(height, bands):
+    bands = max(1, min(int(bands), height))
+    return [height * i // bands for i in range(bands + 1)]
+
+def apply_banded(step, frame, bands, out=None):
+    """
+    Run step.apply on horizontal strips of frame in parallel and stitch the strips into out.
+    Every strip is extended by step.halo() rows on both sides (clipped at the frame edges),
+    so steps whose output row only depends on input rows within the halo give exactly the
+    same result as the unsplit call.
+    """
+    halo = step.halo()
+    if halo is None:
+        raise ValueError(f"{step.__class__.__name__} does not support banded execution")
+    if out is None:
+        out = np.empty(step.output_shape(frame.shape), dtype=frame.dtype)
+    h = frame.shape[0]
+    bounds = band_bounds(h, bands)
+
+    def run(i):
+        band_local.index = i
+        try:
+            y0, y1 = bounds[i], bounds[i + 1]
+            a0, a1 = max(0, y0 - halo), min(h, y1 + halo)
+            if a0 == y0 and a1 == y1:
+                # No halo rows, write straight into the output strip
+                result = step.apply(frame[y0:y1], out=out[y0:y1])
+                if not np.shares_memory(result, out):
+                    out[y0:y1] = result
+            else:
+                band = frame[a0:a1]
+                result = step.apply(band, out=step.buffer("band", step.output_shape(band.shape), band.dtype))
+                out[y0:y1] = result[y0 - a0:y1 - a0]
+        finally:
+            band_local.index = None
+
+    list(band_pool().map(run, range(len(bounds) - 1)))
+    return out
@@ -1,19 +1,144 @@
 # pipeline/base.py
 import os
 import cv2
+import numpy as np
 from os.path import join, dirname
 from util.io import get_unique_output_path
+from .bands import band_local
+
+# Channel formats frames are passed between steps in: "bgr" (3 channels) and "gray" (single channel)
+ALL_FORMATS = ("bgr", "gray")
+
+def channel_format(shape):
+    return "gray" if len(shape) == 2 or shape[2] == 1 else "bgr"
+
+def format_shape(frame_shape, output_format):
+    ''' frame_shape with the channels of output_format, None keeps them. '''
+    if output_format == "gray":
+        return tuple(frame_shape[:2])
+    if output_format == "bgr":
+        return tuple(frame_shape[:2]) + (3,)
+    return tuple(frame_shape)
+
 class PipelineStep:
+    # Point operations map every pixel value independently through a uint8 -> uint8 table (see lut()).
+    # "channel": applied to each channel, "gray": applied after a BGR -> gray conversion.
+    point_op = None
+    # Steps with supports_out accept apply(frame, out=buffer) and write their result into
+    # out, which must have the shape given by output_shape().
+    supports_out = False
+    # Channel formats apply() takes, PipelinePlan converts the frame in front of the step otherwise.
+    accepts = ("bgr",)
+    # Steps that compute a single channel result and convert it back to BGR (thresholds) set
+    # native_gray. PipelinePlan sets output_format to "gray" when every step downstream takes
+    # gray frames, "bgr" keeps the conversion, None keeps the input's format.
+    native_gray = False
+    output_format = None
+    # Seconds spent loading assets (images, ...), which steps do lazily on first use
+    asset_time = 0.0
+    # What param() returns for params missing from params
+    defaults = {}
+
     def __init__(self, global_config, **params):
         self.global_config = global_config
         self.params = params
         self.name = "Unknown"
         self.verbose = True
+        self.version = 0 # Bumped whenever params are changed through edit_parameter/set_param/set_override
+        self.overrides = {} # Temporary values over params (FrameGovernor), never saved by to_dict
+        self.processing_scale = 1.0 # Resolution the step runs at relative to the input, set by PipelinePlan
+        self.arena = None # pipeline.arena.BufferArena, attached by PipelinePlan
+        self._constants = None
+        self._constants_version = None
 
     def apply(self, frame):
         raise NotImplementedError("Must be implemented in subclass")
 
-    def save_output(self, output_root, frame,numbered_files=False):
+    def output_shape(self, frame_shape):
+        ''' Shape of apply()'s result for a frame of frame_shape. '''
+        return tuple(frame_shape)
+
+    def resolve(self):
+        ''' Constants derived from params (cv2 codes, odd kernel sizes, ...), see constants(). '''
+        return {}
+
+    def constants(self):
+        ''' resolve() result, only recomputed after the params version changes. '''
+        if self._constants_version != self.version:
+            self._constants = self.resolve()
+            self._constants_version = self.version
+        return self._constants
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        ''' Scratch buffer recycled across frames by the arena, or None (let OpenCV allocate) without one. '''
+        if self.arena is None:
+            return None
+        band = getattr(band_local, "index", None)
+        if band is not None:
+            # Banded execution, every band needs its own scratch
+            name = f"{name}@{band}"
+        return self.arena.get(self, name, shape, dtype)
+
+    def halo(self):
+        '''
+        Rows of context above/below a horizontal strip this step needs to produce the strip
+        exactly, or None if the step can't run on strips (see pipeline.bands).
+        '''
+        return None
+
+    def lut(self):
+        ''' 256 entry uint8 lookup table equivalent to apply(), only for point_op steps. '''
+        raise NotImplementedError(f"{self.__class__.__name__} is not a point operation")
+
+    def set_processing_scale(self, scale):
+        if scale != self.processing_scale:
+            self.processing_scale = scale
+            self.version += 1
+
+    def output_shape_at(self, frame_shape, scale):
+        ''' output_shape() as if the step ran at processing scale, without touching its params version. '''
+        if scale == self.processing_scale:
+            return tuple(self.output_shape(frame_shape))
+        saved = (self.processing_scale, self._constants, self._constants_version)
+        self.processing_scale, self._constants_version = scale, None
+        try:
+            return tuple(self.output_shape(frame_shape))
+        finally:
+            self.processing_scale, self._constants, self._constants_version = saved
+
+    def scaled(self, value, minimum=1):
+        ''' A size in pixels at full resolution (kernel, border width, ...) at the processing scale. '''
+        return max(minimum, int(round(value * self.processing_scale)))
+
+    def is_static(self):
+        ''' False if apply() can give a different result for the same frame and params (animations). '''
+        return True
+
+    def seek(self, frame_index):
+        ''' Put any per-frame state (animators) where it would be when processing frame_index. '''
+        pass
+
+    def param(self, param_name, default=None):
+        ''' Value of a param, an override replaces the configured value. '''
+        if param_name in self.overrides:
+            return self.overrides[param_name]
+        return self.params.get(param_name, self.defaults.get(param_name, default))
+
+    def set_override(self, param_name, value):
+        ''' Run with value instead of params[param_name] without changing params, None removes the override. '''
+        if value is None:
+            self.overrides.pop(param_name, None)
+        else:
+            self.overrides[param_name] = value
+        self.version += 1
+
+    def set_param(self, param_name, value):
+        self.params[param_name] = value
+        self.overrides.pop(param_name, None) # An edit replaces the override
+        self.version += 1
+
+    def save_output(self, output_root, frame,numbered_files=False, writer=None):
+        ''' If a util.writer.OutputWriter is given, the write happens on its worker threads. '''
         self.verbose = True
         output_file = self.params.get("output_file",None)
         if output_file and self.global_config["save_step_images"]:
@@ -22,6 +147,9 @@ class PipelineStep:
                     out_path = get_unique_output_path(join(output_root,output_file))
                 else:
                     out_path = join(output_root,output_file)
+                if writer is not None:
+                    writer.submit(out_path, frame)
+                    return
                 os.makedirs(dirname(out_path), exist_ok=True)
                 if self.verbose: print(f"[OUTPUT] Writing \'{out_path}\'")
                 success = cv2.imwrite(out_path, frame)
@@ -50,14 +178,17 @@ class PipelineStep:
                 self.params[param_name] = float(self.params[param_name] - (0.1 * multiplier))
         else:
             print(f"ERROR: Editing unknown param type: {type(param)}")
+            return
+        self.overrides.pop(param_name, None)
+        self.version += 1
     
     def to_dict(self):
-        param_dict = self.params
+        # A reordered copy, params itself is read by the pipeline while this runs
         end_keys = ["output_file","enabled"]
+        param_dict = {k: v for k, v in self.params.items() if k not in end_keys}
         for k in end_keys:
-            if k in param_dict:
-                temp = param_dict.pop(k)
-                param_dict[k] = temp
+            if k in self.params:
+                param_dict[k] = self.params[k]
         return {
             "name": self.name,
             "params": param_dict
@@ -1,50 +1,109 @@
 # pipeline/filters.py
 import cv2
 import numpy as np
-from .base import PipelineStep
+from .base import PipelineStep, ALL_FORMATS, format_shape
 from .registry import register
-from util.image_utils import resize_image
+from util.image_utils import resize_image, gray_value
+
+# Every possible uint8 value, used to build lookup tables for point operations
+LUT_RAMP = np.arange(256, dtype=np.uint8).reshape(1, 256)
 
 @register("Flip")
 class FlipStep(PipelineStep):
-    def apply(self, frame):
+    supports_out = True
+    accepts = ALL_FORMATS
+
+    def resolve(self):
         flip_x = self.params.get("flip_x",False)
         flip_y = self.params.get("flip_y",False)
         if not flip_x and not flip_y:
-            self.result = frame
+            flip_code = None
         elif flip_x and flip_y:
-            self.result = cv2.flip(frame,-1)
+            flip_code = -1
         elif flip_x:
-            self.result = cv2.flip(frame,0)
+            flip_code = 0
         else:# elif flip_y:
-            self.result = cv2.flip(frame,1)
+            flip_code = 1
+        return {"flip_code": flip_code}
+
+    def apply(self, frame, out=None):
+        flip_code = self.constants()["flip_code"]
+        if flip_code is None:
+            self.result = frame
+        else:
+            self.result = cv2.flip(frame,flip_code,dst=out)
         return self.result
 
 @register("Blur")
 class BlurStep(PipelineStep):
-    def apply(self, frame):
-        k = self.params.get("ksize", 5)
-        self.result = cv2.GaussianBlur(frame, (k, k), 0)
+    supports_out = True
+    accepts = ALL_FORMATS
+    defaults = {"ksize": 5}
+
+    def resolve(self):
+        k = self.scaled(self.param("ksize"))
+        if self.processing_scale != 1.0 and k % 2 == 0:
+            k += 1  # Keep the kernel centered like the full resolution one
+        return {"ksize": (k, k)}
+
+    def halo(self):
+        return self.constants()["ksize"][1] // 2
+
+    def apply(self, frame, out=None):
+        self.result = cv2.GaussianBlur(frame, self.constants()["ksize"], 0, dst=out)
         return self.result
     
 @register("Threshold")
 class ThresholdStep(PipelineStep):
-    def apply(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        thresh_val = self.params.get("thresh", 128)
-        max_val = self.params.get("max_val", 255)
-        _, self.result = cv2.threshold(gray, thresh_val, max_val, cv2.THRESH_BINARY)
+    point_op = "gray"
+    supports_out = True
+    accepts = ALL_FORMATS
+    native_gray = True
 
-        return cv2.cvtColor(self.result, cv2.COLOR_GRAY2BGR)
+    def resolve(self):
+        return {"thresh": self.params.get("thresh", 128), "max_val": self.params.get("max_val", 255)}
+
+    def output_shape(self, frame_shape):
+        return format_shape(frame_shape, self.output_format)
+
+    def halo(self):
+        return 0
+
+    def lut(self):
+        c = self.constants()
+        return cv2.threshold(LUT_RAMP, c["thresh"], c["max_val"], cv2.THRESH_BINARY)[1]
+
+    def apply(self, frame, out=None):
+        c = self.constants()
+        if frame.ndim == 2:
+            gray, mask = frame, self.buffer("mask", frame.shape, frame.dtype)
+        else:
+            gray = mask = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.buffer("gray", frame.shape[:2], frame.dtype))
+        if len(self.output_shape(frame.shape)) == 2:
+            # Gray output, the plan carries it on without the round trip through BGR
+            _, self.result = cv2.threshold(gray, c["thresh"], c["max_val"], cv2.THRESH_BINARY, dst=out)
+            return self.result
+        _, self.result = cv2.threshold(gray, c["thresh"], c["max_val"], cv2.THRESH_BINARY, dst=mask)
+
+        return cv2.cvtColor(self.result, cv2.COLOR_GRAY2BGR, dst=out)
 
 @register("Invert")
 class InvertImageStep(PipelineStep):
     """Inverts the colors of the image."""
     # def __init__(self):
     #     super().__init__()
+    point_op = "channel"
+    supports_out = True
+    accepts = ALL_FORMATS
+
+    def halo(self):
+        return 0
 
-    def apply(self, frame):
-        self.result = cv2.bitwise_not(frame)
+    def lut(self):
+        return cv2.bitwise_not(LUT_RAMP)
+
+    def apply(self, frame, out=None):
+        self.result = cv2.bitwise_not(frame, dst=out)
         return self.result
 
 @register("AdjustBrightness")
@@ -52,9 +111,21 @@ class AdjustBrightnessStep(PipelineStep):
     ''' Increase Brightness: beta > 0
         Decrease Brightness: beta < 0
     '''
-    def apply(self, frame):
-        beta = self.params.get("beta", 0)  # Brightness shift
-        self.result = cv2.convertScaleAbs(frame, alpha=1.0, beta=beta)
+    point_op = "channel"
+    supports_out = True
+    accepts = ALL_FORMATS
+
+    def resolve(self):
+        return {"beta": self.params.get("beta", 0)}  # Brightness shift
+
+    def halo(self):
+        return 0
+
+    def lut(self):
+        return cv2.convertScaleAbs(LUT_RAMP, alpha=1.0, beta=self.constants()["beta"])
+
+    def apply(self, frame, out=None):
+        self.result = cv2.convertScaleAbs(frame, dst=out, alpha=1.0, beta=self.constants()["beta"])
         return self.result
 
 @register("AdjustContrast")
@@ -62,16 +133,70 @@ class AdjustContrastStep(PipelineStep):
     ''' Increase Contrast: alpha > 1
         Decrease Contrast: 0 > alpha > 1
     '''
-    def apply(self, frame):
-        alpha = self.params.get("alpha", 1.0)  # Contrast scale
-        self.result = cv2.convertScaleAbs(frame, alpha=alpha, beta=0)
+    point_op = "channel"
+    supports_out = True
+    accepts = ALL_FORMATS
+
+    def resolve(self):
+        return {"alpha": self.params.get("alpha", 1.0)}  # Contrast scale
+
+    def halo(self):
+        return 0
+
+    def lut(self):
+        return cv2.convertScaleAbs(LUT_RAMP, alpha=self.constants()["alpha"], beta=0)
+
+    def apply(self, frame, out=None):
+        self.result = cv2.convertScaleAbs(frame, dst=out, alpha=self.constants()["alpha"], beta=0)
         return self.result
 
 @register("ColorShift")
 class ColorShift(PipelineStep):
-    def apply(self, frame):
+    ''' Hue rotation (degrees) and saturation shift in HSV space.
+        uint8 frames take a lookup table path on the uint8 HSV image, the tables are only
+        rebuilt when hue_shift/saturation_shift change. Other dtypes use the float path.
+        self.path reports which one ran last ("lut" or "float").
+    '''
+    supports_out = True
+
+    def __init__(self, global_config, **params):
+        super().__init__(global_config, **params)
+        self.path = None
+
+    def resolve(self):
         hue_shift = self.params.get("hue_shift", 90) % 360
         sat_shift = self.params.get("saturation_shift",0)
+        return {"hue_shift": hue_shift, "sat_shift": sat_shift, "lut": self._build_lut(hue_shift, sat_shift)}
+
+    def halo(self):
+        return 0
+
+    def _build_lut(self, hue_shift, sat_shift):
+        # Same arithmetic as the float path, evaluated once per possible uint8 value
+        values = np.arange(256, dtype=np.float32)
+        lut = np.empty((1, 256, 3), dtype=np.uint8)
+        lut[0, :, 0] = np.clip((values + (hue_shift / 2)) % 180, 0, 255).astype(np.uint8)
+        lut[0, :, 1] = np.clip(values + sat_shift, 0, 255).astype(np.uint8)
+        lut[0, :, 2] = np.arange(256, dtype=np.uint8)
+        return lut
+
+    def apply(self, frame, out=None):
+        c = self.constants()
+        path = "lut" if frame.dtype == np.uint8 else "float"
+        if path != self.path and self.verbose:
+            print(f"[ColorShift] Using {path} path")
+        self.path = path
+
+        if path == "float":
+            self.result = self._apply_float(frame, c["hue_shift"], c["sat_shift"])
+            return self.result
+
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=self.buffer("hsv", frame.shape, frame.dtype))
+        cv2.LUT(hsv, c["lut"], dst=hsv)
+        self.result = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR, dst=out)
+        return self.result
+
+    def _apply_float(self, frame, hue_shift, sat_shift):
         hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV).astype(np.float32)
 
         # Shift hue (OpenCV hue range is [0, 179], so scale down)
@@ -81,67 +206,128 @@ class ColorShift(PipelineStep):
         hsv[..., 1] = hsv[..., 1] + sat_shift
 
         hsv = np.clip(hsv, 0, 255).astype(np.uint8)
-        self.result =  cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-        return self.result
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
     
 @register("Colorize")
 class ColorizeStep(PipelineStep):
-    def apply(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    supports_out = True
+    accepts = ALL_FORMATS
+
+    def output_shape(self, frame_shape):
+        return tuple(frame_shape[:2]) + (3,)
+
+    def resolve(self):
         cmap = self.params.get("colormap", "JET").upper()
-        cmap_id = getattr(cv2, f"COLORMAP_{cmap}", cv2.COLORMAP_JET)
+        return {"cmap_id": getattr(cv2, f"COLORMAP_{cmap}", cv2.COLORMAP_JET)}
 
-        self.result = cv2.applyColorMap(gray, cmap_id)
+    def halo(self):
+        return 0
+
+    def apply(self, frame, out=None):
+        if frame.ndim == 2:
+            gray = frame
+        else:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.buffer("gray", frame.shape[:2], frame.dtype))
+        self.result = cv2.applyColorMap(gray, self.constants()["cmap_id"], dst=out)
         return self.result
     
 @register("GaussianBlur")
 class GaussianBlurStep(PipelineStep):
-    def apply(self, frame):
-        ksize = self.params.get("ksize", 5)
+    supports_out = True
+    accepts = ALL_FORMATS
+    defaults = {"ksize": 5}
+
+    def resolve(self):
+        ksize = self.scaled(self.param("ksize"))
         if ksize % 2 == 0:
             ksize += 1  # must be odd
-        self.result = cv2.GaussianBlur(frame, (ksize, ksize), 0)
+        return {"ksize": (ksize, ksize)}
+
+    def halo(self):
+        return self.constants()["ksize"][1] // 2
+
+    def apply(self, frame, out=None):
+        self.result = cv2.GaussianBlur(frame, self.constants()["ksize"], 0, dst=out)
         return self.result
 
 @register("Tile")
 class TileStep(PipelineStep):
-    def apply(self, frame):
-        n = max(1, int(self.params.get("n", 2)))
-        mirror = bool(self.params.get("mirror", False))
-        downscale = self.params.get("downscale",True)
+    ''' Tiles the frame n x n times (optionally mirrored).
+        The canvas is kept between frames while its shape doesn't change, or written
+        into `out` when the caller provides a buffer of the right shape.
+    '''
+    supports_out = True
+    accepts = ALL_FORMATS
+
+    def __init__(self, global_config, **params):
+        super().__init__(global_config, **params)
+        self._canvas = None
+        self._small = None
+        self._variants = {}  # cv2 flip code -> reusable flipped tile
+
+    def resolve(self):
+        return {"n": max(1, int(self.params.get("n", 2))),
+                "mirror": bool(self.params.get("mirror", False)),
+                "downscale": self.params.get("downscale",True)}
+
+    def output_shape(self, frame_shape):
+        c = self.constants()
+        n = c["n"]
+        h, w = frame_shape[:2]
+        if c["downscale"]:
+            return (h, w) + tuple(frame_shape[2:])
+        return (h * n, w * n) + tuple(frame_shape[2:])
+
+    @staticmethod
+    def _reuse(buf, shape, dtype):
+        # Keep a buffer from the previous frame if it still fits, otherwise let OpenCV allocate
+        return buf if buf is not None and buf.shape == shape and buf.dtype == dtype else None
+
+    def apply(self, frame, out=None):
+        c = self.constants()
+        n, mirror, downscale = c["n"], c["mirror"], c["downscale"]
         h, w = frame.shape[:2]
+        shape = self.output_shape(frame.shape)
 
-        
-        # Create tiled canvas
+        # Tile source
         if downscale:
             # Scale down to tile size
-            small = cv2.resize(frame, (w // n, h // n), interpolation=cv2.INTER_AREA)
-            tiled = np.zeros((h, w, 3), dtype=frame.dtype)
+            th, tw = h // n, w // n
+            dst = self._reuse(self._small, (th, tw) + frame.shape[2:], frame.dtype)
+            self._small = cv2.resize(frame, (tw, th), dst=dst, interpolation=cv2.INTER_AREA)
+            small = self._small
         else:
+            th, tw = h, w
             small = frame
-            tiled = np.zeros((h*n, w*n, 3), dtype=frame.dtype)
-
-        for row in range(n):
-            for col in range(n):
-                tile = small.copy()
-
-                if mirror:
-                    # Flip horizontally if col is odd
-                    if col % 2 == 1:
-                        tile = cv2.flip(tile, 1)
-                    # Flip vertically if row is odd
-                    if row % 2 == 1:
-                        tile = cv2.flip(tile, 0)
-
-                # Place tile in the right spot
-                if downscale:
-                    y0, y1 = row * (h // n), (row + 1) * (h // n)
-                    x0, x1 = col * (w // n), (col + 1) * (w // n)
-                else:
-                    y0, y1 = row * (h), (row + 1) * (h)
-                    x0, x1 = col * (w ), (col + 1) * (w)
-                tiled[y0:y1, x0:x1] = tile
-                    
+
+        # Output canvas, reused across frames
+        if out is not None and out.shape == shape and out.dtype == frame.dtype:
+            tiled = out
+        else:
+            if self._canvas is None or self._canvas.shape != shape or self._canvas.dtype != frame.dtype:
+                self._canvas = np.zeros(shape, dtype=frame.dtype)
+            tiled = self._canvas
+        # Rows/cols left over when h or w isn't divisible by n stay black
+        tiled[n * th:] = 0
+        tiled[:, n * tw:] = 0
+
+        # View the canvas as an (n, th, n, tw, ...) grid of tiles
+        s0, s1 = tiled.strides[:2]
+        grid = np.lib.stride_tricks.as_strided(
+            tiled, shape=(n, th, n, tw) + tiled.shape[2:],
+            strides=(th * s0, s0, tw * s1, s1) + tiled.strides[2:], writeable=True)
+        tile = small[:, None]  # broadcasts over the tile row/col axes
+
+        if not mirror:
+            grid[...] = tile
+        else:
+            # At most four variants: odd cols flip horizontally, odd rows flip vertically
+            grid[0::2, :, 0::2] = tile
+            if n > 1:
+                for flip_code, rows, cols in ((1, 0, 1), (0, 1, 0), (-1, 1, 1)):
+                    dst = self._reuse(self._variants.get(flip_code), small.shape, small.dtype)
+                    variant = self._variants[flip_code] = cv2.flip(small, flip_code, dst=dst)
+                    grid[rows::2, :, cols::2] = variant[:, None]
 
         self.result = tiled
         return self.result
@@ -149,8 +335,16 @@ class TileStep(PipelineStep):
 
 @register("Border")
 class Border(PipelineStep):
-    def apply(self, frame):
-        width = self.params.get("width", 20)
+    supports_out = True
+
+    @property
+    def accepts(self):
+        # A colored border on a gray frame would change what a later gray conversion sees
+        color = self.constants()["color"]
+        return ALL_FORMATS if color[0] == color[1] == color[2] else ("bgr",)
+
+    def resolve(self):
+        width = self.scaled(self.params.get("width", 20), minimum=0)
         color = self.params.get("color", [0, 0, 0])  # default black BGR
 
         # Ensure color is in BGR list form
@@ -158,6 +352,16 @@ class Border(PipelineStep):
             color = list(color)
         if len(color) != 3:
             color = [0, 0, 0]
+        return {"width": width, "color": color, "gray": gray_value(color)}
+
+    def output_shape(self, frame_shape):
+        width = self.constants()["width"]
+        return (frame_shape[0] + 2 * width, frame_shape[1] + 2 * width) + tuple(frame_shape[2:])
+
+    def apply(self, frame, out=None):
+        c = self.constants()
+        width = c["width"]
+        color = c["color"] if frame.ndim == 3 else c["gray"]
 
         self.result = cv2.copyMakeBorder(
             frame,
@@ -166,7 +370,8 @@ class Border(PipelineStep):
             left=width,
             right=width,
             borderType=cv2.BORDER_CONSTANT,
-            value=color
+            value=color,
+            dst=out
         )
         return self.result
     
@@ -182,16 +387,32 @@ class ResizeStep(PipelineStep):
         "output_file": null}
     }
     """
-    def apply(self, frame):
-        size = self.params.get("size", [640, 480])  # [width, height]
-        keep_aspect = self.params.get("keep_aspect", True)
-        pad_color = tuple(self.params.get("pad_color", [0, 0, 0]))
-        result = resize_image(frame, size, keep_aspect, pad_color)
+    supports_out = True
+
+    @property
+    def accepts(self):
+        # Same as Border for colored padding
+        c = self.constants()
+        color = c["pad_color"]
+        return ALL_FORMATS if not c["keep_aspect"] or color[0] == color[1] == color[2] else ("bgr",)
+
+    def resolve(self):
+        return {"size": tuple(self.scaled(v) for v in self.params.get("size", [640, 480])),  # [width, height]
+                "keep_aspect": self.params.get("keep_aspect", True),
+                "pad_color": tuple(self.params.get("pad_color", [0, 0, 0]))}
+
+    def output_shape(self, frame_shape):
+        w, h = self.constants()["size"]
+        return (h, w) + tuple(frame_shape[2:])
+
+    def apply(self, frame, out=None):
+        c = self.constants()
+        result = resize_image(frame, c["size"], c["keep_aspect"], c["pad_color"], out)
         return result
 
-# TODO: add automatic inference of the input_type (e.g., detect if the frame has 1 vs 3 channels, so you don’t have to specify it manually
 @register("ColorConvert")   
 class ColorConvertStep(PipelineStep):
+    ''' Without an "input_type" param the input is taken to be gray for single channel frames, bgr otherwise. '''
     COLOR_MAP = {
         ("bgr", "gray"): cv2.COLOR_BGR2GRAY,
         ("bgr", "rgb"): cv2.COLOR_BGR2RGB,
@@ -205,15 +426,44 @@ class ColorConvertStep(PipelineStep):
         ("gray", "rgb"): cv2.COLOR_GRAY2RGB,
     }
 
-    def apply(self, frame):
-        input_type = self.params.get("input_type", "bgr").lower()
-        output_type = self.params.get("output_type", "gray").lower()
+    supports_out = True
 
-        if (input_type, output_type) not in self.COLOR_MAP:
+    @property
+    def accepts(self):
+        # rgb and hsv inputs are 3 channel frames, "bgr" as far as the plan is concerned
+        return tuple(sorted({"gray" if fmt == "gray" else "bgr" for fmt in self.constants()["codes"]}))
+
+    def resolve(self):
+        input_type = self.params.get("input_type")
+        output_type = self.params.get("output_type", "gray").lower()
+        # cvtColor code by input channel format (None: already in output_type)
+        codes = {}
+        for fmt in ALL_FORMATS if input_type is None else (input_type.lower(),):
+            if fmt == output_type:
+                codes[fmt] = None
+            elif (fmt, output_type) in self.COLOR_MAP:
+                codes[fmt] = self.COLOR_MAP[(fmt, output_type)]
+        if not codes:
             raise ValueError(
-                f"Unsupported color conversion: {input_type} -> {output_type}"
+                f"Unsupported color conversion: {input_type or 'bgr'} -> {output_type}"
             )
+        return {"codes": codes, "channels": 1 if output_type == "gray" else 3}
 
-        code = self.COLOR_MAP[(input_type, output_type)]
-        self.result = cv2.cvtColor(frame, code)
+    def output_shape(self, frame_shape):
+        if self.constants()["channels"] == 1:
+            return tuple(frame_shape[:2])
+        return tuple(frame_shape[:2]) + (3,)
+
+    def halo(self):
+        return 0
+
+    def apply(self, frame, out=None):
+        c = self.constants()
+        codes = c["codes"]
+        # An explicit rgb/hsv input_type has the only code
+        code = codes.get("gray" if frame.ndim == 2 else "bgr", next(iter(codes.values())))
+        if code is None:
+            self.result = frame
+        else:
+            self.result = cv2.cvtColor(frame, code, dst=out)
         return self.result
\ No newline at end of file
@@ -1,3 +1,5 @@
+import os
+import time
 import cv2
 import numpy as np
 from os.path import join
@@ -22,25 +24,53 @@ class LayerStep(PipelineStep):
                 print(f"Creating Animator for {k}")
                 self.animators[k] = Animator(config=v)
 
-        # Load source image (with alpha if present)
-        self.original_img  = cv2.imread(self.params["in_file"], cv2.IMREAD_UNCHANGED)
-        if self.original_img  is None:
-            raise FileNotFoundError(f"Layer source not found: {self.original_img}")
+        # The source image is decoded on first use (see original_img), a missing or unreadable file still fails here
+        if not os.path.exists(self.params["in_file"]):
+            raise FileNotFoundError(f"Layer source not found: {self.params['in_file']}")
+        if not cv2.haveImageReader(self.params["in_file"]):
+            raise ValueError(f"Layer source is not a readable image: {self.params['in_file']}")
+        self._original_img = None
         
         # Cache
-        self._cached_img = None
+        self._cached_img = None    # Transformed sprite, BGR premultiplied by alpha (if the source has alpha)
+        self._cached_inv_alpha = None  # uint8 plane of 255 - (alpha * opacity) per channel, None without alpha
         self._cached_params = None
 
+    @property
+    def original_img(self):
+        """ Source image (with alpha if present), loaded on first access. """
+        if self._original_img is None:
+            start = time.perf_counter()
+            self._original_img = cv2.imread(self.params["in_file"], cv2.IMREAD_UNCHANGED)
+            self.asset_time += time.perf_counter() - start
+            if self._original_img is None:
+                raise ValueError(f"Failed to read layer source: {self.params['in_file']}")
+        return self._original_img
+
+    def seek(self, frame_index):
+        # apply() steps the animators before drawing, so frame i uses the value after i+1 steps
+        for k, v in self.animators.items():
+            v.seek(frame_index)
+            self.params[k] = v.value
+
+    def is_static(self):
+        return self.params["paused"] or not self.animators
+
+    def _cache_key(self):
+        return (self.params["scale"], self.params["rotation"], self.params["opacity"], self.processing_scale)
+
     def _update_cache(self, frame_shape):
         h, w = frame_shape[:2]
         img = self.original_img
 
         # compute target size
-        new_w = int(img.shape[1] * self.params["scale"])
-        new_h = int(img.shape[0] * self.params["scale"])
+        scale = self.params["scale"] * self.processing_scale
+        new_w = int(img.shape[1] * scale)
+        new_h = int(img.shape[0] * scale)
 
         if new_w <= 0 or new_h <= 0:
             self._cached_img = None
+            self._cached_params = self._cache_key()
             return
 
         # resize
@@ -62,11 +92,22 @@ class LayerStep(PipelineStep):
             rotated = cv2.warpAffine(resized, M, (new_w_rot, new_h_rot), flags=cv2.INTER_LINEAR,
                     borderMode=cv2.BORDER_CONSTANT,
                     borderValue=(0, 0, 0, 0))  # RGBA black/transparent)
-            self._cached_img = rotated
+            sprite = rotated
+        else:
+            sprite = resized
+
+        if sprite.ndim == 3 and sprite.shape[2] == 4:
+            # Premultiply once here so the per frame blend is out = premul + roi * (255 - a) / 255
+            opacity = min(max(self.params["opacity"], 0.0), 1.0)
+            alpha = np.rint(sprite[:, :, 3] * opacity).astype(np.uint16)
+            premul = (sprite[:, :, :3].astype(np.uint16) * alpha[:, :, None] + 127) // 255
+            self._cached_img = premul.astype(np.uint8)
+            self._cached_inv_alpha = cv2.merge([(255 - alpha).astype(np.uint8)] * 3)
         else:
-            self._cached_img = resized
+            self._cached_img = sprite
+            self._cached_inv_alpha = None
 
-        self._cached_params = (self.params["scale"], self.params["rotation"])
+        self._cached_params = self._cache_key()
 
     def apply(self, frame):
         if self.original_img is None:
@@ -78,7 +119,7 @@ class LayerStep(PipelineStep):
                 if isinstance(v, Animator):
                     self.params[k] = v.step()
         # check cache
-        if self._cached_params != (self.params["scale"], self.params["rotation"]):
+        if self._cached_params != self._cache_key():
             self._update_cache(frame.shape)
 
         if self._cached_img is None:
@@ -115,13 +156,13 @@ class LayerStep(PipelineStep):
         roi = frame[y1_clip:y2_clip, x1_clip:x2_clip]
         layer_crop = layer[ly1:ly2, lx1:lx2]
 
-        # handle transparency (if source has alpha)
-        if layer_crop.shape[2] == 4:
-            alpha = (layer_crop[:, :, 3] / 255.0) * self.params["opacity"]
-            for c in range(3):
-                roi[:, :, c] = (1 - alpha) * roi[:, :, c] + alpha * layer_crop[:, :, c]
+        # handle transparency (if source has alpha), blended in place on the roi
+        if self._cached_inv_alpha is not None:
+            # Fixed point: roi = roi * (255 - a) / 255 + premultiplied layer
+            inv_alpha = self._cached_inv_alpha[ly1:ly2, lx1:lx2]
+            cv2.multiply(roi, inv_alpha, dst=roi, scale=1 / 255)
+            cv2.add(roi, layer_crop, dst=roi)
         else:
             cv2.addWeighted(layer_crop, self.params["opacity"], roi, 1 - self.params["opacity"], 0, roi)
 
-        frame[y1_clip:y2_clip, x1_clip:x2_clip] = roi
         return frame
\ No newline at end of file
@@ -0,0 +1,583 @@
+# pipeline/plan.py
+import time
+import cv2
+import numpy as np
+from .arena import BufferArena
+from .bands import apply_banded
+from .base import ALL_FORMATS, channel_format, format_shape
+
+class FusedPointStep:
+    """
+    A run of consecutive point operations (see PipelineStep.point_op) collapsed into
+    a single cv2.LUT pass. The composed table is rebuilt only when one of the fused
+    steps changes its params (tracked through PipelineStep.version).
+    """
+    supports_out = True
+    accepts = ALL_FORMATS
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.name = "+".join(step.name for step in steps)
+        self._versions = None
+        self._pre_lut = None   # Applied per channel before the gray conversion (None = identity)
+        self._lut = None       # Applied per channel, or to the gray image if self._gray
+        self._gray = False
+        self.arena = None
+        self.output_format = None  # See PipelineStep.native_gray
+
+    @property
+    def version(self):
+        return tuple(step.version for step in self.steps)
+
+    @property
+    def native_gray(self):
+        return any(step.point_op == "gray" for step in self.steps)
+
+    def output_shape(self, frame_shape):
+        if self.native_gray:
+            return format_shape(frame_shape, self.output_format)
+        return tuple(frame_shape)
+
+    def constants(self):
+        if self._versions != self.version:
+            self._build()
+        return {"pre_lut": self._pre_lut, "lut": self._lut, "gray": self._gray}
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        return None if self.arena is None else self.arena.get(self, name, shape, dtype)
+
+    def _build(self):
+        pre_lut, lut, gray = None, None, False
+        for step in self.steps:
+            step_lut = step.lut().reshape(256)
+            if step.point_op == "gray" and not gray:
+                # Everything composed so far has to run before the gray conversion
+                pre_lut, lut, gray = lut, None, True
+            lut = step_lut if lut is None else step_lut[lut]
+        self._pre_lut, self._lut, self._gray = pre_lut, lut, gray
+        self._versions = tuple(step.version for step in self.steps)
+
+    def apply(self, frame, out=None):
+        self.constants()
+        gray_out = len(self.output_shape(frame.shape)) == 2
+
+        if frame.ndim == 2:
+            lut = self._lut if self._pre_lut is None else self._lut[self._pre_lut]
+            if gray_out:
+                return cv2.LUT(frame, lut, dst=out)
+            gray = cv2.LUT(frame, lut, dst=self.buffer("gray", frame.shape, frame.dtype))
+            return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=out)
+        if not self._gray:
+            return cv2.LUT(frame, self._lut, dst=out)
+        if self._pre_lut is not None:
+            frame = cv2.LUT(frame, self._pre_lut, dst=self.buffer("pre", frame.shape, frame.dtype) if gray_out else out)
+        if gray_out:
+            # Single channel result, the plan carries it on as is
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=out)
+            return cv2.LUT(gray, self._lut, dst=gray)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.buffer("gray", frame.shape[:2], frame.dtype))
+        cv2.LUT(gray, self._lut, dst=gray)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=out)
+
+class RescaleStep:
+    """
+    Resize between processing scales, inserted by PipelinePlan where the scale changes
+    (after the input, around steps with their own "processing_scale", before the output).
+    Downscales use INTER_AREA, upscales INTER_LINEAR.
+    """
+    supports_out = True
+    point_op = None
+    internal = True  # Not a configured step, never passed to run()'s on_step
+    accepts = ALL_FORMATS
+    native_gray = False
+    output_format = None
+
+    def __init__(self, from_scale, to_scale):
+        self.from_scale = from_scale
+        self.to_scale = to_scale
+        self.name = f"Rescale {from_scale:g}->{to_scale:g}"
+        self.params = {}
+        self.version = 0
+        self.arena = None
+        self.interpolation = cv2.INTER_AREA if to_scale < from_scale else cv2.INTER_LINEAR
+        self.target = None  # Exact (h, w) to produce, set by PipelinePlan for the final upscale
+
+    def constants(self):
+        return {}
+
+    def halo(self):
+        return None
+
+    def output_shape(self, frame_shape):
+        if self.target is not None:
+            return tuple(self.target) + tuple(frame_shape[2:])
+        factor = self.to_scale / self.from_scale
+        h = max(1, int(round(frame_shape[0] * factor)))
+        w = max(1, int(round(frame_shape[1] * factor)))
+        return (h, w) + tuple(frame_shape[2:])
+
+    def apply(self, frame, out=None):
+        h, w = self.output_shape(frame.shape)[:2]
+        return cv2.resize(frame, (w, h), dst=out, interpolation=self.interpolation)
+
+class ConvertStep:
+    """
+    Channel format conversion ("bgr" <-> "gray"), inserted by PipelinePlan in front of a
+    step that doesn't accept the format the frame is in.
+    """
+    supports_out = True
+    point_op = None
+    internal = True
+    accepts = ALL_FORMATS
+    native_gray = False
+    output_format = None
+    CODES = {("gray", "bgr"): cv2.COLOR_GRAY2BGR, ("bgr", "gray"): cv2.COLOR_BGR2GRAY}
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.code = self.CODES[(source, target)]
+        self.name = f"Convert {source}->{target}"
+        self.params = {}
+        self.version = 0
+        self.arena = None
+
+    def constants(self):
+        return {}
+
+    def halo(self):
+        return 0
+
+    def output_shape(self, frame_shape):
+        return format_shape(frame_shape, self.target)
+
+    def apply(self, frame, out=None):
+        return cv2.cvtColor(frame, self.code, dst=out)
+
+class PlanEntry:
+    """ One compiled step of a PipelinePlan: inferred shapes and its pre-sized output buffer. """
+    def __init__(self, step, key, in_shape, out_shape, dtype, out=None, bands=1):
+        self.step = step
+        self.key = key  # (id(step), params version, output format) the entry was compiled for
+        self.in_shape = in_shape
+        self.out_shape = out_shape
+        self.dtype = dtype
+        self.out = out
+        self.bands = bands  # > 1: run on horizontal strips in parallel (pipeline.bands)
+        # Result caching (PipelinePlan cache=True)
+        self.valid = False  # Computed from the current frame key with the current params
+        self.result = None  # Kept output, None if it didn't fit the cache budget
+        self.cost = 0.0     # Seconds the last computation took
+
+    @property
+    def channels(self):
+        return self.out_shape[2] if len(self.out_shape) == 3 else 1
+
+    def __repr__(self):
+        name = getattr(self.step, "name", self.step.__class__.__name__)
+        bands = f" [{self.bands} bands]" if self.bands > 1 else ""
+        return f"[{name.center(20)}] {self.in_shape} -> {self.out_shape} ({self.channels} ch){bands}"
+
+class PipelinePlan:
+    """
+    Execution layer over the step list built by main.load_pipeline.
+
+    The step list is shared with the caller (reordering and enabling steps still works
+    by editing it), the plan regroups the enabled steps whenever that list changes.
+    Runs of two or more point operations are fused into one FusedPointStep.
+    With debug=True (or fuse=False) every step runs on its own so the profiler keeps
+    per-step attribution.
+
+    compile() infers every step's output shape/channels for an input frame shape,
+    pre-resolves step constants (PipelineStep.constants) and pre-sizes output buffers.
+    When a step's params or position change, only the entries from that step on are
+    recompiled. run() compiles on demand.
+    With use_arena, steps that support it write into buffers recycled from self.arena,
+    so the returned frame is only valid until the next run().
+    Read-only input frames (frame stack views) are passed on as they are and only copied in
+    front of a step without an out buffer, which may draw on its input.
+    Steps in skip_steps (ids, filled by util.governor.FrameGovernor) only run on every
+    other frame, if they don't change the frame shape.
+
+    With a processing_scale below 1 the frame is downscaled once before the first step,
+    the steps run with their resolution dependent params scaled to match (see
+    PipelineStep.scaled) and the result is upscaled once at the end, to the size the full
+    resolution chain would produce. A step's own "processing_scale" param overrides it.
+
+    With cache=True and a frame_key passed to run() (static image input), every entry keeps
+    its output. Nothing runs while the frame key and params stay the same, and a change to
+    step k only recomputes from k on. Steps that aren't static (PipelineStep.is_static) run
+    every time. After a run that recomputed anything, outputs other than the final one are
+    dropped, cheapest to recompute first, until the memory the cache keeps alive fits in
+    cache_budget_mb (see cache_bytes). The arena "out" buffers are reused every frame with
+    or without the cache and aren't counted; outputs held outside them and the input copies
+    below are, and evicting an entry releases both. Steps that draw on their input in place
+    get a copy of it, so cached outputs are never modified, but the caller must copy the
+    returned frame before drawing on it.
+
+    With negotiate=True the channel format ("bgr"/"gray") of every frame passed between
+    steps is negotiated (see _negotiate): steps with native_gray hand their single channel
+    result on as is while the steps after them accept gray frames, and conversions are only
+    inserted in front of steps that don't accept the format the frame is in.
+    """
+    def __init__(self, steps, fuse=True, debug=False, use_arena=True, verbose=False, processing_scale=1.0,
+                 cache=False, cache_budget_mb=256, negotiate=True):
+        self.steps = steps
+        self.processing_scale = processing_scale
+        self.cache = cache
+        self.cache_budget_mb = cache_budget_mb
+        self.cache_bytes = 0
+        self._cache_frame_key = None
+        self.fuse = fuse
+        self.debug = debug
+        self.verbose = verbose
+        self.arena = BufferArena() if use_arena else None
+        self._signature = None
+        self._groups = []
+        self._unfused = []
+        self.entries = []
+        self._compiled_for = None  # (input shape, dtype, fused)
+        self.compile_count = 0
+        self.skip_steps = set()
+        self.step_costs = {}  # id(group) -> moving average of its run time in seconds
+        self.frame_index = 0
+        self.negotiate = negotiate
+        self._negotiated = None  # (signature, groups with conversions)
+        self._converters = {}    # (id(group), source, target) -> ConvertStep in front of group
+
+    def _step_scale(self, step):
+        scale = step.params.get("processing_scale")
+        return float(scale) if scale is not None else float(self.processing_scale)
+
+    def _build_groups(self):
+        groups = []
+        unfused = []
+        run = []
+        current = 1.0  # Frames come in at full resolution
+        for step in self.steps:
+            if not step.params.get("enabled", True):
+                continue
+            scale = self._step_scale(step)
+            step.set_processing_scale(scale)
+            if scale != current:
+                groups.extend(self._close_run(run))
+                run = []
+                rescale = RescaleStep(current, scale)
+                groups.append(rescale)
+                unfused.append(rescale)
+                current = scale
+            unfused.append(step)
+            if step.point_op is not None:
+                run.append(step)
+                continue
+            groups.extend(self._close_run(run))
+            run = []
+            groups.append(step)
+        groups.extend(self._close_run(run))
+        if current != 1.0:
+            rescale = RescaleStep(current, 1.0)
+            groups.append(rescale)
+            unfused.append(rescale)
+        self._groups = groups
+        self._unfused = unfused
+        self._converters = {}
+
+    def _close_run(self, run):
+        if len(run) > 1:
+            # Keep the existing group (and its compiled entry) if the run didn't change
+            for group in self._groups:
+                if isinstance(group, FusedPointStep) and group.steps == run:
+                    return [group]
+            return [FusedPointStep(run)]
+        return run
+
+    def groups(self):
+        signature = (self.processing_scale,) + tuple((id(step), step.params.get("enabled", True),
+                                                       step.params.get("processing_scale")) for step in self.steps)
+        if signature != self._signature:
+            self._signature = signature
+            self._build_groups()
+            for group in self._groups + self._unfused + self.steps:
+                group.arena = self.arena
+            if self.arena is not None:
+                # Drop buffers of fused and rescale groups that no longer exist
+                self.arena.prune(self._groups + self._unfused + self.steps)
+        return self._groups
+
+    def _use_fusion(self, dtype, on_step=None):
+        return self.fuse and not self.debug and on_step is None and dtype == np.uint8
+
+    def compile(self, frame_shape, dtype=np.uint8, fused=True):
+        """ Compile (or recompile the changed suffix of) the plan for frames of frame_shape. """
+        fused_groups = self.groups()
+        groups = fused_groups if fused else self._unfused
+        frame_shape = tuple(frame_shape)
+        groups = self._negotiate(groups, frame_shape)
+
+        start = 0
+        if self._compiled_for == (frame_shape, dtype, fused):
+            keys = [self._entry_key(group) for group in groups]
+            while start < min(len(keys), len(self.entries)) and self.entries[start].key == keys[start]:
+                start += 1
+            if start == len(keys) == len(self.entries):
+                return self.entries
+
+        self._compiled_for = (frame_shape, dtype, fused)
+        final = groups[-1] if groups else None
+        if isinstance(final, RescaleStep) and final.to_scale == 1.0:
+            final.target = self._full_output_shape(frame_shape)[:2]
+        shape = frame_shape if start == 0 else self.entries[start - 1].out_shape
+        return self._compile_from(start, shape, dtype, groups)
+
+    @staticmethod
+    def _entry_key(group):
+        return (id(group), group.version, group.output_format)
+
+    def _negotiate(self, groups, frame_shape):
+        """
+        Channel formats between groups. The reference is the chain with every output_format
+        at None, where a BGR frame stays BGR. A native_gray group outputs gray when the groups
+        after it accept gray frames until one of them brings the frame back to its reference
+        format (or the chain ends in it). Their channel independent operations see the same
+        value in every channel in the reference, so the output doesn't change.
+        A conversion (ConvertStep) goes in front of any group that doesn't accept the frame's format.
+        Returns groups with the conversions inserted.
+        """
+        if not self.negotiate:
+            return groups
+        signature = (frame_shape, tuple((id(group), group.version) for group in groups))
+        if self._negotiated is not None and self._negotiated[0] == signature:
+            return self._negotiated[1]
+
+        # Reference format after every group
+        reference = []
+        shape = frame_shape
+        for group in groups:
+            if group.native_gray:
+                group.output_format = None
+            if channel_format(shape) not in group.accepts:
+                shape = format_shape(shape, group.accepts[0])
+            shape = tuple(group.output_shape(shape))
+            reference.append(channel_format(shape))
+
+        negotiated = []
+        shape = frame_shape
+        for i, group in enumerate(groups):
+            fmt = channel_format(shape)
+            if fmt not in group.accepts:
+                key = (id(group), fmt, group.accepts[0])
+                if key not in self._converters:
+                    self._converters[key] = ConvertStep(fmt, group.accepts[0])
+                    self._converters[key].arena = self.arena
+                negotiated.append(self._converters[key])
+                shape = format_shape(shape, group.accepts[0])
+            if group.native_gray:
+                gray = self._accepts_gray(groups, i + 1, format_shape(shape, "gray"), reference)
+                group.output_format = "gray" if gray else reference[i]
+            negotiated.append(group)
+            shape = tuple(group.output_shape(shape))
+        self._negotiated = (signature, negotiated)
+        return negotiated
+
+    @staticmethod
+    def _accepts_gray(groups, start, shape, reference):
+        # Can a gray frame (shape) go into groups[start] without a conversion or a change to the result
+        for k in range(start, len(groups)):
+            if channel_format(shape) == reference[k - 1]:
+                return True  # Back on the reference path
+            group = groups[k]
+            if channel_format(shape) not in group.accepts:
+                return False
+            if group.native_gray:
+                return True  # Picks its own output format the same way
+            shape = tuple(group.output_shape(shape))
+        return channel_format(shape) == reference[-1]
+
+    def _full_output_shape(self, frame_shape):
+        # What the chain would output at full resolution, the target of the final upscale
+        shape = tuple(frame_shape)
+        for step in self._unfused:
+            if not isinstance(step, RescaleStep):
+                shape = step.output_shape_at(shape, 1.0)
+        return shape
+
+    def _compile_from(self, start, shape, dtype, groups):
+        entries = self.entries[:start]
+        for group in groups[start:]:
+            group.constants()
+            out_shape = tuple(group.output_shape(shape))
+            out = None
+            if self.arena is not None and group.supports_out:
+                out = self.arena.get(group, "out", out_shape, dtype)
+            entries.append(PlanEntry(group, self._entry_key(group), shape, out_shape, dtype, out,
+                                     self._bands(group, shape)))
+            shape = out_shape
+        self.entries = entries
+        self.compile_count += 1
+        if self.verbose:
+            print(f"[Plan] Compiled steps {start+1}-{len(entries)} of {len(entries)}")
+        return self.entries
+
+    def _bands(self, group, shape):
+        # Opt-in per step with a "bands" param, only for steps that can run on strips
+        params = getattr(group, "params", {})
+        bands = int(params.get("bands", 1))
+        if bands <= 1 or group.halo() is None:
+            return 1
+        return min(bands, shape[0])
+
+    def describe(self):
+        return "\n".join(repr(entry) for entry in self.entries)
+
+    def invalidate(self):
+        """ Drop all cached step outputs, the next run() computes every step. """
+        for entry in self.entries:
+            entry.valid = False
+            entry.result = None
+
+    def _apply_entry(self, entry, frame, profiler):
+        group = entry.step
+        if isinstance(group, FusedPointStep):
+            name = f"Fused[{group.name}]"
+        else:
+            name = group.name if isinstance(group, (RescaleStep, ConvertStep)) else group.__class__.__name__
+        if profiler is not None: profiler.start_step(name)
+        started = time.perf_counter()
+        if entry.bands > 1:
+            frame = apply_banded(group, frame, entry.bands, out=entry.out)
+        elif entry.out is not None:
+            frame = group.apply(frame, out=entry.out)
+        else:
+            frame = group.apply(frame)
+        elapsed = time.perf_counter() - started
+        if profiler is not None: profiler.end_step()
+        # Per instance, the profiler groups steps by name
+        cost = self.step_costs.get(id(group))
+        self.step_costs[id(group)] = elapsed if cost is None else cost + 0.1 * (elapsed - cost)
+        return frame
+
+    def run(self, frame, profiler=None, on_step=None, frame_key=None):
+        """
+        Apply all enabled steps to frame.
+        on_step(step, frame) is called after every configured step (not the plan's own
+        rescales and conversions), which needs every intermediate output, so fusion is skipped for that call.
+        frame_key identifies the input frame for result caching (see cache), with caching
+        on_step is only called for the steps that actually ran.
+        """
+        fused = self._use_fusion(frame.dtype, on_step)
+        entries = self.compile(frame.shape, frame.dtype, fused)
+        if self.arena is not None:
+            self.arena.begin_frame()
+        if self.cache and frame_key is not None:
+            return self._run_cached(entries, frame, frame_key, profiler, on_step)
+        self.frame_index += 1
+        skip_odd = self.skip_steps and self.frame_index % 2 == 1
+
+        i = 0
+        while i < len(entries):
+            entry = entries[i]
+            if frame.shape != entry.in_shape:
+                # A step produced a shape the plan didn't predict, recompile from here
+                entries = self._compile_from(i, frame.shape, frame.dtype, [e.step for e in entries])
+                entry = entries[i]
+            group = entry.step
+            if skip_odd and id(group) in self.skip_steps and entry.in_shape == entry.out_shape:
+                i += 1
+                continue
+            if not group.supports_out and not frame.flags.writeable:
+                # Steps without an out buffer may draw on their input, read-only frames (frame stack views) are copied first
+                frame = frame.copy()
+            frame = self._apply_entry(entry, frame, profiler)
+            if on_step is not None and not getattr(group, "internal", False):
+                on_step(group, frame)
+            i += 1
+        return frame
+
+    def _run_cached(self, entries, frame, frame_key, profiler, on_step):
+        if frame_key != self._cache_frame_key:
+            self._cache_frame_key = frame_key
+            for entry in entries:
+                entry.valid = False
+        # Entries recompiled since the last run start out invalid, everything after them is recompiled too
+        valid = 0
+        while valid < len(entries) and entries[valid].valid and self._is_static(entries[valid].step):
+            valid += 1
+        # Resume from the last kept output inside the unchanged prefix
+        start = valid
+        while start > 0 and entries[start - 1].result is None:
+            start -= 1
+        if profiler is not None:
+            profiler.record("Cached steps", start)
+        if start == len(entries):
+            return entries[-1].result if entries else frame
+        if start > 0:
+            frame = entries[start - 1].result
+
+        i = start
+        while i < len(entries):
+            entry = entries[i]
+            if frame.shape != entry.in_shape:
+                entries = self._compile_from(i, frame.shape, frame.dtype, [e.step for e in entries])
+                entry = entries[i]
+            group = entry.step
+            if not group.supports_out:
+                # Steps without an out buffer may draw on their input, which is a cached output
+                buf = self._cache_buffer(group, frame)
+                np.copyto(buf, frame)
+                frame = buf
+            started = time.perf_counter()
+            frame = self._apply_entry(entry, frame, profiler)
+            entry.cost = time.perf_counter() - started
+            entry.valid = True
+            entry.result = frame
+            if on_step is not None and not getattr(group, "internal", False):
+                on_step(group, frame)
+            i += 1
+        self._enforce_cache_budget(entries)
+        return frame
+
+    @staticmethod
+    def _is_static(group):
+        if isinstance(group, FusedPointStep):
+            return all(step.is_static() for step in group.steps)
+        return group.is_static() if hasattr(group, "is_static") else True
+
+    def _cache_buffer(self, group, frame):
+        if self.arena is None:
+            return np.empty_like(frame)
+        return self.arena.get(group, "cache_in", frame.shape, frame.dtype)
+
+    def _enforce_cache_budget(self, entries):
+        # The final output is always kept, the others by how long they take to recompute
+        budget = self.cache_budget_mb * 2**20
+        outs = [entry.out for entry in entries if entry.out is not None]
+        used = self._held_bytes(entries[-1], outs) if entries else 0
+        for entry in sorted(entries[:-1], key=lambda e: e.cost, reverse=True):
+            if entry.result is None:
+                continue
+            held = self._held_bytes(entry, outs)
+            if used + held > budget:
+                self._evict(entry)
+            else:
+                used += held
+        self.cache_bytes = used
+
+    def _held_bytes(self, entry, outs):
+        # Arena out buffers are reused every run anyway, only memory kept alive for the cache counts
+        held = 0
+        if entry.result is not None and not any(np.may_share_memory(entry.result, out) for out in outs):
+            held += entry.result.nbytes
+        copy = self._cache_copy(entry)
+        if copy is not None and (entry.result is None or not np.may_share_memory(entry.result, copy)):
+            held += copy.nbytes
+        return held
+
+    def _cache_copy(self, entry):
+        if self.arena is None or entry.step.supports_out:
+            return None
+        return self.arena.peek(entry.step, "cache_in")
+
+    def _evict(self, entry):
+        entry.result = None
+        if self.arena is not None and not entry.step.supports_out:
+            self.arena.release(entry.step, "cache_in")
@@ -1,5 +1,13 @@
 # pipeline/registry.py
+import time
+import importlib
+
 PIPELINE_REGISTRY = {}
+# Modules that register steps. They are imported by create_step() the first time a config
+# names a step that isn't registered yet, so a pipeline only pays for the modules it uses.
+STEP_MODULES = ["pipeline.filters", "pipeline.layer"]
+_discovered = set()
+discovery_time = 0.0 # Seconds spent importing step modules
 
 def register(name):
     def decorator(cls):
@@ -7,7 +15,22 @@ def register(name):
         return cls
     return decorator
 
+def discover(name=None):
+    """ Import step modules until name is registered, or all of them with name=None. """
+    global discovery_time
+    for module in STEP_MODULES:
+        if name is not None and name in PIPELINE_REGISTRY:
+            return
+        if module in _discovered:
+            continue
+        start = time.perf_counter()
+        importlib.import_module(module)
+        discovery_time += time.perf_counter() - start
+        _discovered.add(module)
+
 def create_step(name, global_config, params):
+    if name not in PIPELINE_REGISTRY:
+        discover(name)
     cls = PIPELINE_REGISTRY.get(name)
     
     if cls is None:
@@ -16,4 +39,3 @@ def create_step(name, global_config, params):
     step = cls(global_config, **params)
     step.name = name
     return step#cls(global_config, **params)
-
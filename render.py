@@ -0,0 +1,266 @@
+# render.py
+# Headless batch rendering: runs a pipeline config once over an image, a folder of images
+# or a video without opening a window, processing frames on a pool of worker processes.
+import os
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+import cv2
+
+from main import load_pipeline
+from pipeline.plan import PipelinePlan
+from util.io import open_input_stream, list_image_sequence, IMAGE_EXTENSIONS
+from util.profiler import PipelineProfiler
+from tools.viewport_tool import Viewport, ViewportAnimator
+
+# Per worker process state, built once by _init_worker
+_worker = None
+
+class FrameRenderer:
+    """
+    Processes frames by index. Stateful parts (Layer animators, the viewport animator)
+    are seeked to the frame index first, so any process renders frame i the same way.
+    """
+    def __init__(self, cfg, pipe_config):
+        self.steps = load_pipeline(cfg, pipe_config, verbose=False)
+        for step in self.steps:
+            step.verbose = False
+        self.plan = PipelinePlan(self.steps, fuse=cfg.get("fuse_point_ops", True),
+                                 use_arena=cfg.get("buffer_arena", True),
+                                 processing_scale=cfg.get("processing_scale", 1.0),
+                                 negotiate=cfg.get("negotiate_formats", True))
+        # Optional viewport animation, states are [x, y, w, h, a, steps]
+        self.vp_states = cfg.get("viewport_states", [])
+        self.vp = None
+        self.vp_animator = ViewportAnimator()
+        for state in self.vp_states:
+            self.vp_animator.add_state(state[:5], steps=state[5] if len(state) > 5 else 40)
+        self.vp_animator.playing = len(self.vp_states) > 0
+        # Drained after every frame with take_step_times()
+        self.profiler = PipelineProfiler()
+
+    def render(self, index, frame):
+        for step in self.steps:
+            step.seek(index)
+        if self.vp_animator.playing:
+            if self.vp is None:
+                self.vp = Viewport(frame)
+                self.vp.debug = False
+            self.vp_animator.seek(index)
+            self.vp_animator.update()
+            self.vp.set_state(self.vp_animator.current_state)
+            self.vp.image = frame
+            self.vp.update()
+            frame = self.vp.view
+        # The plan's output lives in a recycled buffer, hand back a copy
+        return self.plan.run(frame, self.profiler).copy()
+
+    def render_timed(self, index, frame):
+        """ render() plus the frame time and per-step times, for the parent's profiler. """
+        start = time.perf_counter()
+        result = self.render(index, frame)
+        return result, time.perf_counter() - start, self.profiler.take_step_times()
+
+def _init_worker(cfg, pipe_config):
+    global _worker
+    _worker = FrameRenderer(cfg, pipe_config)
+
+def _render_frame(index, frame):
+    return (index, *_worker.render_timed(index, frame))
+
+def _render_image(index, path, out_path):
+    # Workers read and write the images themselves, only timings go back to the parent
+    frame = cv2.imread(path)
+    if frame is None:
+        print(f"[Warning] Failed to read image: {path}")
+        return index, None, {}
+    result, elapsed, step_times = _worker.render_timed(index, frame)
+    cv2.imwrite(out_path, result)
+    return index, elapsed, step_times
+
+def resolve_pipe_config(cfg, pipe_config):
+    """
+    Inline the step list and give every random animator a fixed seed, so all worker
+    processes build identical pipelines.
+    """
+    if pipe_config.get("load_from_file"):
+        with open(pipe_config["pipe"], "r") as f:
+            pipe = json.load(f)
+    else:
+        pipe = pipe_config["pipe"]
+    pipe = json.loads(json.dumps(pipe))
+    base_seed = cfg.get("seed", 0)
+    for i, step in enumerate(pipe):
+        for v in step.get("params", {}).values():
+            if isinstance(v, dict) and "mode" in v:
+                v.setdefault("seed", base_seed + i)
+    return {"load_from_file": False, "pipe": pipe}
+
+def detect_input(cfg, input_path=None):
+    """
+    Returns (kind, path) with kind "image", "folder", "sequence" (glob pattern or an
+    image_sequence config), "frame_stack" or "video". Defaults to the config's input.
+    """
+    if input_path is None:
+        if cfg["input_type"] == "live":
+            raise ValueError("Batch rendering needs a file or folder input, not a live feed")
+        input_path = join(cfg["input_root"], cfg["input_source"])
+        if cfg["input_type"] == "image_sequence":
+            return "sequence", input_path
+    if any(c in input_path for c in "*?[") and not os.path.exists(input_path):
+        return "sequence", input_path
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Input not found: {input_path}")
+    if os.path.isdir(input_path):
+        return "folder", input_path
+    if os.path.splitext(input_path)[1].lower() in IMAGE_EXTENSIONS:
+        return "image", input_path
+    if os.path.splitext(input_path)[1].lower() == ".npy":
+        return "frame_stack", input_path
+    return "video", input_path
+
+def render_images(cfg, pipe_config, paths, output_dir, workers, profiler):
+    """
+    Render every image in paths into output_dir, at the same path relative to the folder
+    all of them are in (so images of a recursive glob don't overwrite each other).
+    Images are independent, so they run in any order.
+    """
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else ""
+    jobs = [(i, path, join(output_dir, os.path.relpath(os.path.abspath(path), root))) for i, path in enumerate(paths)]
+    for out_dir in {os.path.dirname(job[2]) for job in jobs} | {output_dir}:
+        os.makedirs(out_dir, exist_ok=True)
+    workers = max(1, min(workers, len(jobs)))
+    print(f"=====\nRendering {len(jobs)} image(s) -> '{output_dir}' with {workers} workers")
+
+    def done(elapsed, step_times):
+        if elapsed is not None:
+            profiler.add_frame(elapsed, step_times)
+
+    if workers == 1:
+        _init_worker(cfg, pipe_config)
+        for job in jobs:
+            done(*_render_image(*job)[1:])
+        return output_dir
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cfg, pipe_config)) as pool:
+        for _, elapsed, step_times in pool.map(_render_image, *zip(*jobs), chunksize=max(1, len(jobs) // (4 * workers))):
+            done(elapsed, step_times)
+    return output_dir
+
+def render_video(cfg, pipe_config, video_path, output_path, workers, profiler, calibration_frames=20, input_type="video"):
+    """
+    Render a video (or a "frame_stack") with a process pool. Frames are read in order, processed in parallel
+    and written in order. The first calibration_frames are processed serially to estimate
+    the speedup of the parallel part.
+    """
+    stream = open_input_stream("", input_type, video_path, 0,
+                               threaded=True, buffer_size=cfg.get("capture_buffer", 4) + workers)
+    fps = (stream.cap.get(cv2.CAP_PROP_FPS) if input_type == "video" else 0) or cfg.get("framerate", 30) or 30
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    video_writer = None
+
+    def write(frame):
+        nonlocal video_writer
+        if video_writer is None:
+            h, w = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*cfg.get("record_codec", "mp4v"))
+            video_writer = cv2.VideoWriter(output_path, fourcc, fps, (w, h), frame.ndim == 3)
+        video_writer.write(frame)
+
+    print(f"=====\nRendering '{video_path}' -> '{output_path}' with {workers} workers")
+    if workers == 1:
+        calibration_frames = float("inf")
+    index = 0
+    finished = False
+
+    # Serial calibration
+    renderer = FrameRenderer(cfg, pipe_config)
+    serial_start = time.perf_counter()
+    while index < calibration_frames:
+        frame = stream.read()
+        if frame is None:
+            finished = True
+            break
+        result, elapsed, step_times = renderer.render_timed(index, frame)
+        profiler.add_frame(elapsed, step_times)
+        write(result)
+        index += 1
+    serial_time = time.perf_counter() - serial_start
+    serial_frames = index
+    del renderer
+
+    # Parallel render, at most 2 frames per worker in flight
+    parallel_start = time.perf_counter()
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cfg, pipe_config)) as pool:
+        while not finished:
+            frame = stream.read()
+            finished = frame is None
+            if not finished:
+                pending.append(pool.submit(_render_frame, index, frame))
+                index += 1
+            while pending and (finished or len(pending) >= 2 * workers or pending[0].done()):
+                _, result, elapsed, step_times = pending.popleft().result()
+                profiler.add_frame(elapsed, step_times)
+                write(result)
+    parallel_time = time.perf_counter() - parallel_start
+    parallel_frames = index - serial_frames
+
+    stream.release()
+    if video_writer is not None:
+        video_writer.release()
+
+    # Report
+    print(f"Frames: {index} | Serial: {serial_frames} in {serial_time:.2f}s | Parallel: {parallel_frames} in {parallel_time:.2f}s")
+    if serial_frames > 0 and parallel_frames > 0 and parallel_time > 0:
+        serial_fps = serial_frames / serial_time
+        parallel_fps = parallel_frames / parallel_time
+        print(f"Serial: {serial_fps:.1f} FPS | Parallel: {parallel_fps:.1f} FPS | Speedup: {parallel_fps / serial_fps:.2f}x")
+    return output_path
+
+def render(config_path, input_path=None, workers=None, output_path=None, calibration_frames=20):
+    """
+    Run a pipeline config once over an image, a folder of images, a video or a frame stack, without a window.
+    Images are written to output_path (default: output_root/output_label/), videos to
+    output_path (default: output_root/output_label.mp4).
+    """
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    cfg = config["config"]
+    pipe_config = resolve_pipe_config(cfg, config["pipe_config"])
+    workers = workers or os.cpu_count() or 1
+    label = cfg.get("output_label", "render")
+    kind, path = detect_input(cfg, input_path)
+    profiler = PipelineProfiler(window_size=cfg.get("profile_window", 65536))
+
+    start = time.perf_counter()
+    if kind in {"video", "frame_stack"}:
+        output_path = output_path or join(cfg["output_root"], f"{label}.mp4")
+        render_video(cfg, pipe_config, path, output_path, workers, profiler, calibration_frames, kind)
+    else:
+        if kind == "folder":
+            paths = list_image_sequence(path)
+        elif kind == "sequence":
+            sequence = cfg.get("sequence", {})
+            paths = list_image_sequence(path, sequence.get("start", 0), sequence.get("end"), sequence.get("step", 1))
+        else:
+            paths = [path]
+        output_path = output_path or join(cfg["output_root"], label)
+        render_images(cfg, pipe_config, paths, output_path, workers, profiler)
+    profiler.print_throughput(time.perf_counter() - start)
+    print(f"Output written to {output_path}\n")
+    return output_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a pipeline config headless over an image, a folder of images, a video or a frame stack")
+    parser.add_argument("config", help="Pipeline config")
+    parser.add_argument("--input", default=None, help="Image, folder or video to render (default: the config's input)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--output", default=None, help="Output folder for images, or output video path (default: output_root/output_label)")
+    parser.add_argument("--calibration-frames", type=int, default=20, help="Video frames rendered serially to measure speedup")
+    args = parser.parse_args()
+    render(args.config, args.input, args.workers, args.output, args.calibration_frames)
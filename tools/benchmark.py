@@ -0,0 +1,193 @@
+# tools/benchmark.py
+# Headless micro-benchmark: times every registered step and every pipeline in configs/*.json
+# over synthetic frames, saves the results as JSON and compares them against a baseline.
+#   python tools/benchmark.py --sizes 480p 1080p --output bench.json
+#   python tools/benchmark.py --baseline bench.json --threshold 0.15
+#   python tools/benchmark.py --frames output/recordings/live.npy   (replay recorded frames instead)
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import tempfile
+from os.path import join, dirname, abspath, basename
+import cv2
+import numpy as np
+
+sys.path.append(dirname(dirname(abspath(__file__))))
+from pipeline.registry import PIPELINE_REGISTRY, create_step, discover
+from pipeline.plan import PipelinePlan
+from util.io import open_frame_stack
+
+SIZES = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080), "4k": (3840, 2160)}
+SPRITE_FILE = "benchmark_sprite.png"
+# Params needed to construct a step on its own (everything else uses the step's defaults)
+STEP_PARAMS = {"Layer": {"source": SPRITE_FILE}}
+
+def synthetic_frame(size, seed=0):
+    """ Noise over a colour gradient, so thresholds, LUTs and colour conversions all see a spread of values. """
+    w, h = size
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, w, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    base = np.dstack([np.broadcast_to(x, (h, w)), np.broadcast_to(y, (h, w)), (x + y) / 2])
+    noise = rng.normal(0, 24, (h, w, 3)).astype(np.float32)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+def write_sprite(root):
+    """ RGBA sprite used for Layer, so the benchmark doesn't depend on files in input_root. """
+    sprite = np.zeros((256, 256, 4), dtype=np.uint8)
+    cv2.circle(sprite, (128, 128), 100, (40, 200, 255, 255), -1)
+    cv2.GaussianBlur(sprite, (31, 31), 0, dst=sprite)
+    cv2.imwrite(join(root, SPRITE_FILE), sprite)
+
+def load_frames(path, limit):
+    """ Up to limit frames of a recorded frame stack, copied into memory so page faults aren't timed. """
+    return list(np.array(open_frame_stack(path)[:limit]))
+
+def time_plan(plan, frames, warmup, iterations):
+    """ Returns warm-up and steady-state timings (ms/frame) of plan.run, cycling through frames. """
+    warm = []
+    for i in range(warmup):
+        start = time.perf_counter()
+        plan.run(frames[i % len(frames)])
+        warm.append((time.perf_counter() - start) * 1000)
+    times = np.empty(iterations)
+    for i in range(iterations):
+        frame = frames[i % len(frames)]
+        start = time.perf_counter()
+        plan.run(frame)
+        times[i] = (time.perf_counter() - start) * 1000
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {"first_ms": warm[0] if warm else None,
+            "warmup_ms": float(np.mean(warm)) if warm else None,
+            "mean_ms": float(times.mean()), "p50_ms": float(p50), "p95_ms": float(p95),
+            "p99_ms": float(p99), "max_ms": float(times.max()), "iterations": iterations}
+
+def load_config_steps(path, global_config):
+    with open(path, "r") as f:
+        config = json.load(f)
+    pipe_config = config["pipe_config"]
+    if pipe_config.get("load_from_file"):
+        with open(pipe_config["pipe"], "r") as f:
+            pipe = json.load(f)
+    else:
+        pipe = pipe_config["pipe"]
+    cfg = dict(config["config"], **global_config)
+    steps = []
+    for step in pipe:
+        params = dict(step.get("params", {}))
+        if step["name"] == "Layer":
+            # Layer assets live on the rig, benchmark with the synthetic sprite instead
+            params["source"] = SPRITE_FILE
+        steps.append(create_step(step["name"], cfg, params))
+    return steps
+
+def benchmark_cases(global_config, step_names=None, config_paths=()):
+    """ Yields (case name, step list factory). Steps are rebuilt per frame size so no state carries over. """
+    discover()
+    for name in PIPELINE_REGISTRY:
+        if step_names and name not in step_names:
+            continue
+        yield f"step:{name}", lambda name=name: [create_step(name, global_config, dict(STEP_PARAMS.get(name, {})))]
+    for path in config_paths:
+        yield f"config:{basename(path)}", lambda path=path: load_config_steps(path, global_config)
+
+def run_benchmark(sizes, step_names=None, config_paths=(), warmup=5, iterations=50, fuse=True, frames_path=None):
+    """ Synthetic frames for every size in sizes, or the recorded frames of frames_path (keyed by its file name). """
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        write_sprite(root)
+        global_config = {"input_root": root, "output_root": root}
+        if frames_path:
+            inputs = {basename(frames_path): load_frames(frames_path, warmup + iterations)}
+        else:
+            inputs = {size_name: [synthetic_frame(SIZES[size_name])] for size_name in sizes}
+        for frames in inputs.values():
+            for frame in frames:
+                # Shared by every case, the plan copies it in front of steps that draw in place (Layer)
+                frame.flags.writeable = False
+        for size_name, frames in inputs.items():
+            for case, build in benchmark_cases(global_config, step_names, config_paths):
+                key = f"{case}@{size_name}"
+                try:
+                    steps = build()
+                except Exception as e:
+                    # Configs may reference assets that only exist on the rig
+                    print(f"[Warning] Skipping {key}: {e}")
+                    continue
+                for step in steps:
+                    step.verbose = False
+                plan = PipelinePlan(steps, fuse=fuse)
+                results[key] = time_plan(plan, frames, warmup, iterations)
+                r = results[key]
+                first = "     n/a" if r["first_ms"] is None else f"{r['first_ms']:8.2f}"
+                print(f"[{key.center(36)}] first {first} | p50 {r['p50_ms']:8.2f} | "
+                      f"p95 {r['p95_ms']:8.2f} | p99 {r['p99_ms']:8.2f} | max {r['max_ms']:8.2f} ms")
+    return results
+
+def environment():
+    return {"python": platform.python_version(), "opencv": cv2.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "cpu_count": os.cpu_count(), "cv2_threads": cv2.getNumThreads(),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+def compare(results, baseline, threshold=0.1, metric="p50_ms"):
+    """ Prints the change of every case against baseline, returns the keys slower than (1 + threshold) x baseline. """
+    regressions = []
+    print(f"=====\nComparison against baseline ({metric}, threshold {threshold*100:.0f}%):")
+    for key, r in results.items():
+        base = baseline.get(key)
+        if base is None or not base.get(metric):
+            print(f"[{key.center(36)}] new")
+            continue
+        change = r[metric] / base[metric] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(key)
+            flag = " [REGRESSION]"
+        print(f"[{key.center(36)}] {base[metric]:8.2f} -> {r[metric]:8.2f} ms ({change*100:+.1f}%){flag}")
+    print(f"{len(regressions)} regression(s)")
+    return regressions
+
+def positive_int(value):
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+if __name__ == "__main__":
+    root_directory = dirname(dirname(abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Benchmark pipeline steps and configs on synthetic frames")
+    parser.add_argument("--sizes", nargs="+", default=["480p", "1080p", "4k"], choices=list(SIZES))
+    parser.add_argument("--steps", nargs="*", default=None, help="Registered step names (default: all)")
+    parser.add_argument("--configs", nargs="*", default=None, help="Pipeline configs (default: configs/*.json)")
+    parser.add_argument("--no-configs", action="store_true", help="Only benchmark single steps")
+    parser.add_argument("--frames", default=None, help="Replay a recorded frame stack (.npy) instead of synthetic frames")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--iterations", type=positive_int, default=50)
+    parser.add_argument("--no-fuse", action="store_true", help="Run config pipelines without point-op fusion")
+    parser.add_argument("--output", default=None, help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Compare against a previous --output file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed slowdown before a case counts as a regression")
+    parser.add_argument("--metric", default="p50_ms", choices=["mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+    args = parser.parse_args()
+
+    config_paths = []
+    if not args.no_configs:
+        config_paths = args.configs if args.configs is not None else sorted(glob.glob(join(root_directory, "configs", "*.json")))
+    env = environment()
+    print(f"=====\nBenchmark: {env}\n=====")
+    results = run_benchmark(args.sizes, args.steps, config_paths, args.warmup, args.iterations, not args.no_fuse, args.frames)
+
+    if args.output:
+        os.makedirs(dirname(abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"environment": env, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if compare(results, baseline["results"], args.threshold, args.metric):
+            sys.exit(1)
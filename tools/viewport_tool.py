@@ -21,6 +21,8 @@ class Viewport:
         self.dy = 0
         self.da = 0
 
+        self.path = None  # Extraction used by the last update(): "passthrough", "slice" or "warp"
+        self._view_buffer = None
         self.debug = True
 
     def stop(self):
@@ -61,38 +63,37 @@ class Viewport:
         self.x += self.dx
         self.y += self.dy
         self.a = (self.a + self.da) % 360
-        self.check_bounds()
-
-        # Create a copy of the original image
-        display_image = self.image.copy()
 
-        # Calculate rotated box region dimensions
+        # Calculate rotated box region dimensions (before the bounds check, so the result
+        # only depends on the current state and not on the previous update)
         self.rw = int(self.w * np.abs(np.cos(np.radians(self.a))) + self.h * np.abs(np.sin(np.radians(self.a))))
         self.rh = int(self.w * np.abs(np.sin(np.radians(self.a))) + self.h * np.abs(np.cos(np.radians(self.a))))
+        self.check_bounds()
 
-        # Extract the region within the rotated box
-        rotated_box_region = cv2.getRectSubPix(display_image, (self.rw, self.rh), (self.x , self.y ))
-
-        # Unrotate the viewport in the extracted region
-        if abs(np.sin(np.radians(self.a))) > abs(np.cos(np.radians(self.a))):
-            M = cv2.getRotationMatrix2D((self.rw / 2, self.rh / 2), self.a+90, 1)
-        else:
-            M = cv2.getRotationMatrix2D((self.rw / 2, self.rh / 2), self.a, 1)
-        unrotated_box_region = cv2.warpAffine(rotated_box_region, M, (self.rw, self.rh))
-
-        # Extract the viewport from the unrotated image
-        if abs(np.sin(np.radians(self.a))) > abs(np.cos(np.radians(self.a))):
-            viewport_region = cv2.getRectSubPix(unrotated_box_region, (self.h, self.w), (self.rw/2 , self.rh/2 ))
-            # Transpose the image (swap width and height)
-            viewport_region = cv2.transpose(viewport_region)
-            # Flip the transposed image horizontally
-            viewport_region = cv2.flip(viewport_region, 1)
+        ih, iw = self.image.shape[:2]
+        x0, y0 = self.x - self.w / 2, self.y - self.h / 2
+        axis_aligned = self.a % 360 == 0
+        if axis_aligned and (x0, y0, self.w, self.h) == (0, 0, iw, ih):
+            # Viewport covers the whole frame
+            self.path = "passthrough"
+            self.view = self.image
+        elif (axis_aligned and float(x0).is_integer() and float(y0).is_integer()
+                and x0 >= 0 and y0 >= 0 and x0 + self.w <= iw and y0 + self.h <= ih):
+            # Integer crop, zero copy view into the source
+            self.path = "slice"
+            x0, y0 = int(x0), int(y0)
+            self.view = self.image[y0:y0 + self.h, x0:x0 + self.w]
         else:
-            viewport_region = cv2.getRectSubPix(unrotated_box_region, (self.w, self.h), (self.rw/2 , self.rh/2 ))
-
-        self.view = viewport_region
+            # Crop + rotation in one affine map from view pixels to source pixels
+            self.path = "warp"
+            view_shape = (self.h, self.w) + self.image.shape[2:]
+            if self._view_buffer is None or self._view_buffer.shape != view_shape or self._view_buffer.dtype != self.image.dtype:
+                self._view_buffer = np.empty(view_shape, dtype=self.image.dtype)
+            self.view = cv2.warpAffine(self.image, self.get_view_matrix(), (self.w, self.h), dst=self._view_buffer,
+                                       flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
 
         if self.debug:
+            display_image = self.image.copy()
             # Draw Bounding Box
             box = cv2.boxPoints(((self.x, self.y), (self.rw, self.rh), 0))
             box = np.int0(box)
@@ -123,6 +124,18 @@ class Viewport:
             # cv2.imshow('Viewport Region', viewport_region)
 
 
+    def get_view_matrix(self):
+        '''
+        2x3 affine matrix mapping view pixel (u,v) to source pixel coordinates.
+        The view is centered on (x,y) and rotated by a degrees (counterclockwise), pixel
+        centers sit at +0.5 so an axis aligned view at integer x - w/2 maps 1:1 to source pixels.
+        '''
+        c = np.cos(np.radians(self.a))
+        s = np.sin(np.radians(self.a))
+        du, dv = 0.5 - self.w / 2, 0.5 - self.h / 2
+        return np.array([[c, -s, self.x - 0.5 + c * du - s * dv],
+                         [s,  c, self.y - 0.5 + s * du + c * dv]], dtype=np.float64)
+
     def move(self, direction, step=10, mode="absolute"):
         '''
         Move viewport
@@ -259,6 +272,13 @@ class ViewportAnimator:
             # Animator paused
             pass
 
+    def seek(self, frame_index):
+        '''
+        Set the animation position so the next update() produces the state for frame_index.
+        '''
+        if len(self.steps) > 0:
+            self.current_step = frame_index % sum(self.steps)
+
     def add_state(self,state,steps=40):
         '''
         State should be format [x,y,w,h,a]
@@ -2,44 +2,78 @@ import math
 import random
 
 class Animator:
+    """
+    Animates a param value over frames. The value after n calls to step() only depends
+    on n (random mode draws its targets from a seeded generator), so seek() can jump to
+    any frame and reproduce exactly what a serial playback would have produced.
+    """
     def __init__(self, config):
         self.mode = config.get("mode", "static")
-        self.points = config.get("points", [0])
+        self.points = list(config.get("points", [0]))
         self.speed = config.get("speed", 1)
         self.interpolation = config.get("interpolation", "linear")
 
         self.current_index = 0
         self.t = 0.0  # progress between waypoints
         self.value = self.points[0] if self.points else 0
+        self.steps_taken = 0
 
         # Random-specific setup
         self.bounds = config.get("bounds", [(0.1, 0.1), (0.9, 0.9)])
         self.min_distance = config.get("min_distance", 0.2)
+        self.seed = config.get("seed", random.randrange(2**32))
+        self._start_points = list(self.points)
+        self._segment_cache = (0, list(self.points))  # (segment, points) of the furthest segment computed
+
+        # Progress values within one segment, accumulated the same way step-by-step playback would
+        self._segment_t = [0.0]
+        t = 0.0
+        while True:
+            t += 1.0 / max(1, self.speed)
+            if t >= 1.0:
+                break
+            self._segment_t.append(t)
+
+    def seek(self, steps_taken):
+        """ Jump to the state after steps_taken calls to step(). """
+        self.steps_taken = steps_taken
+        self.value = self.value_at(steps_taken)
+        return self.value
 
     def step(self):
+        return self.seek(self.steps_taken + 1)
+
+    def value_at(self, steps_taken):
         if self.mode == "static":
             return self.value
 
-        elif self.mode == "waypoints":
-            self.t += 1.0 / max(1, self.speed)
-            if self.t >= 1.0:
-                self.t = 0.0
-                self.current_index = (self.current_index + 1) % len(self.points)
+        segment, i = divmod(steps_taken, len(self._segment_t))
+        self.t = self._segment_t[i]
 
+        if self.mode == "waypoints":
+            self.current_index = segment % len(self.points)
             p1 = self.points[self.current_index]
             p2 = self.points[(self.current_index + 1) % len(self.points)]
             return self._interpolate(p1, p2, self.t)
 
         elif self.mode == "random":
-            self.t += 1.0 / max(1, self.speed)
-            if self.t >= 1.0:
-                self.t = 0.0
-                self.points[0] = self.points[1]  # shift target -> current
-                self.points[1] = self._random_point()
-
-            p1, p2 = self.points
+            p1, p2 = self._random_segment(segment)
             return self._interpolate(p1, p2, self.t)
 
+    def _random_segment(self, segment):
+        # Each segment moves from the previous target to a new one, so walk forward from
+        # the closest computed segment (restarting if seeking backwards)
+        cached_segment, points = self._segment_cache
+        if segment < cached_segment:
+            cached_segment, points = 0, list(self._start_points)
+        while cached_segment < segment:
+            cached_segment += 1
+            rng = random.Random(self.seed * 1000003 + cached_segment)
+            points = [points[1], self._random_point(rng, points[1])]
+        self._segment_cache = (cached_segment, points)
+        self.points = list(points)
+        return points
+
     def _interpolate(self, a, b, t):
         if self.interpolation == "sine":
             t = (1 - math.cos(t * math.pi)) / 2
@@ -48,11 +82,11 @@ class Animator:
         else:
             return a + (b - a) * t
 
-    def _random_point(self):
+    def _random_point(self, rng, last_point):
         while True:
-            x = random.uniform(self.bounds[0][0], self.bounds[1][0])
-            y = random.uniform(self.bounds[0][1], self.bounds[1][1])
-            if self._distance((x, y), self.points[-1]) >= self.min_distance:
+            x = rng.uniform(self.bounds[0][0], self.bounds[1][0])
+            y = rng.uniform(self.bounds[0][1], self.bounds[1][1])
+            if self._distance((x, y), last_point) >= self.min_distance:
                 return (x, y)
 
     def _distance(self, a, b):
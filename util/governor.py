@@ -0,0 +1,150 @@
+# util/governor.py
+
+class FrameGovernor:
+    """
+    Opt-in frame-budget governor. Every interval frames it compares the profiler's mean
+    frame time with the budget (1 / target_fps):
+        above degrade_above x budget for patience checks in a row: degrade one step
+        below restore_below x budget for patience checks in a row: undo the last degradation
+    The gap between the two thresholds, patience and the cooldown after every decision
+    (counters restart, so the next check only sees frames taken with the new settings)
+    keep it from oscillating.
+
+    Only steps that declare a knob in their params are touched, the most expensive one
+    first (PipelinePlan.step_costs, timed per step instance):
+        "min_ksize": blur kernel is reduced by 2 per decision, down to min_ksize. This is a
+                     step override (PipelineStep.set_override), params keep the configured
+                     value, and editing ksize meanwhile drops the override
+        "optional":  the step only runs on every other frame (PipelinePlan.skip_steps)
+    When no step knob is left and min_scale is set, the plan's processing_scale is lowered
+    by scale_step per decision, down to min_scale.
+    Every decision is printed and kept in self.log.
+    """
+    def __init__(self, plan, profiler, target_fps, degrade_above=1.0, restore_below=0.75,
+                 patience=2, interval=None, min_scale=None, scale_step=0.75, verbose=True):
+        self.plan = plan
+        self.profiler = profiler
+        self.budget = 1.0 / target_fps if target_fps else 0
+        self.degrade_above = degrade_above
+        self.restore_below = restore_below
+        self.patience = patience
+        self.min_scale = min_scale
+        self.scale_step = scale_step
+        self.interval = interval or profiler.window_size
+        self.verbose = verbose
+        self.actions = []  # Applied degradations, undone last-in first-out
+        self.log = []
+        self._frames = 0
+        self._over = 0
+        self._under = 0
+
+    @property
+    def level(self):
+        return len(self.actions)
+
+    def update(self):
+        """ Call once per frame, after profiler.end_frame(). Returns the decision made, if any. """
+        if not self.budget:
+            return None
+        self._frames += 1
+        if self._frames < self.interval:
+            return None
+        self._frames = 0
+        frame_time = self.profiler.frame_times.mean()
+        if frame_time > self.budget * self.degrade_above:
+            self._over, self._under = self._over + 1, 0
+        elif frame_time < self.budget * self.restore_below:
+            self._over, self._under = 0, self._under + 1
+        else:
+            self._over, self._under = 0, 0
+
+        decision = None
+        if self._over >= self.patience:
+            decision = self._degrade()
+        elif self._under >= self.patience and self.actions:
+            decision = self._restore()
+        if decision is not None:
+            self._over, self._under = 0, 0
+            self._log(decision, frame_time)
+        return decision
+
+    def _candidates(self):
+        candidates = []
+        for step in self.plan.steps:
+            params = step.params
+            if not params.get("enabled", True):
+                continue
+            cost = self.plan.step_costs.get(id(step), 0.0)
+            min_ksize = params.get("min_ksize")
+            ksize = step.param("ksize")
+            if min_ksize is not None and ksize is not None and ksize - 2 >= min_ksize:
+                candidates.append((cost, "ksize", step))
+            # Point operations run fused, skipping them would save nothing
+            if params.get("optional", False) and step.point_op is None and id(step) not in self.plan.skip_steps:
+                candidates.append((cost, "skip", step))
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return candidates
+
+    def _degrade(self):
+        candidates = self._candidates()
+        if not candidates:
+            return self._degrade_scale()
+        _, kind, step = candidates[0]
+        if kind == "ksize":
+            old = step.param("ksize")
+            action = {"kind": kind, "step": step, "old": old, "new": old - 2,
+                      "override": step.overrides.get("ksize")}
+            step.set_override("ksize", old - 2)
+        else:
+            self.plan.skip_steps.add(id(step))
+            action = {"kind": kind, "step": step}
+        self.actions.append(action)
+        return dict(action, decision="degrade")
+
+    def _degrade_scale(self):
+        old = self.plan.processing_scale
+        new = round(old * self.scale_step, 3)
+        if self.min_scale is None or new < self.min_scale:
+            return None
+        self.plan.processing_scale = new
+        action = {"kind": "scale", "step": None, "old": old, "new": new}
+        self.actions.append(action)
+        return dict(action, decision="degrade")
+
+    def _restore(self):
+        action = self.actions.pop()
+        step = action["step"]
+        if action["kind"] == "scale":
+            self.plan.processing_scale = action["old"]
+        elif action["kind"] == "ksize":
+            # Unless the user edited ksize since, which already dropped the override
+            if step.overrides.get("ksize") == action["new"]:
+                step.set_override("ksize", action["override"])
+        else:
+            self.plan.skip_steps.discard(id(step))
+        return dict(action, decision="restore")
+
+    def reset(self):
+        """ Undo every degradation. """
+        while self.actions:
+            self._log(self._restore(), self.profiler.frame_times.mean())
+
+    def _log(self, decision, frame_time):
+        step = decision["step"]
+        name = step.name if step is not None else "Pipeline"
+        old, new = decision.get("old"), decision.get("new")
+        if decision["decision"] == "restore":
+            old, new = new, old
+        if decision["kind"] == "ksize":
+            change = f"ksize {old} -> {new}"
+        elif decision["kind"] == "scale":
+            change = f"processing_scale {old:g} -> {new:g}"
+        else:
+            change = "every other frame" if decision["decision"] == "degrade" else "every frame"
+        entry = {"frame": self.profiler.frame_count, "frame_ms": frame_time * 1000, "decision": decision["decision"],
+                 "step": name, "change": change, "level": self.level}
+        self.log.append(entry)
+        self.profiler.record("Governor level", self.level)
+        if self.verbose:
+            print(f"[Governor] {frame_time*1000:.1f} ms/frame (budget {self.budget*1000:.1f} ms): "
+                  f"{entry['decision']} {name}, {change} (level {self.level})")
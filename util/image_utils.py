@@ -2,16 +2,34 @@
 import cv2
 import numpy as np
 
-def resize_image(image, output_size, keep_aspect=True, padding_color=(0, 0, 0)):
+def gray_value(color):
+    ''' Gray level of a BGR color, the same cv2.COLOR_BGR2GRAY gives for a pixel of that color. '''
+    return int(cv2.cvtColor(np.uint8([[list(color)[:3]]]), cv2.COLOR_BGR2GRAY)[0, 0])
+
+def resize_image(image, output_size, keep_aspect=True, padding_color=(0, 0, 0), out=None):
+    ''' If out (target_h x target_w) is given the result is written into it. '''
     target_w, target_h = output_size
 
     if not keep_aspect:
-        return cv2.resize(image, (target_w, target_h), interpolation=cv2.INTER_AREA)
+        return cv2.resize(image, (target_w, target_h), dst=out, interpolation=cv2.INTER_AREA)
 
     h, w = image.shape[:2]
     scale = min(target_w / w, target_h / h)
     new_w, new_h = int(w * scale), int(h * scale)
 
+    if out is not None:
+        # Resize straight into the middle of out and fill the padding around it
+        pad_left = (target_w - new_w) // 2
+        pad_top = (target_h - new_h) // 2
+        color = gray_value(padding_color) if out.ndim == 2 else padding_color[:out.shape[2]]
+        out[:pad_top] = color
+        out[pad_top + new_h:] = color
+        out[pad_top:pad_top + new_h, :pad_left] = color
+        out[pad_top:pad_top + new_h, pad_left + new_w:] = color
+        cv2.resize(image, (new_w, new_h), dst=out[pad_top:pad_top + new_h, pad_left:pad_left + new_w],
+                   interpolation=cv2.INTER_AREA)
+        return out
+
     resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA)
 
     pad_left = (target_w - new_w) // 2
@@ -24,7 +42,7 @@ def resize_image(image, output_size, keep_aspect=True, padding_color=(0, 0, 0)):
         pad_top, pad_bottom ,
         pad_left, pad_right,
         borderType=cv2.BORDER_CONSTANT,
-        value=padding_color
+        value=gray_value(padding_color) if image.ndim == 2 else padding_color
     )
     # print(f"Desired Size: {output_size} - Result: {result.shape}")
     return result
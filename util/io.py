@@ -4,10 +4,12 @@ import time
 import os
 from os.path import join
 import re
+import glob
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-
-import tkinter as tk
-from tkinter import filedialog
+import numpy as np
 
 def file_dialog(mode="open", initial_dir=".", filetypes=(("All files", "*.*"),), title="Select a file", defaultextension=None):
     """
@@ -22,6 +24,8 @@ def file_dialog(mode="open", initial_dir=".", filetypes=(("All files", "*.*"),),
     Returns:
         str or None: Selected file path, or None if canceled.
     """
+    import tkinter as tk # Only imported when a dialog is actually opened
+    from tkinter import filedialog
     root = tk.Tk()
     root.withdraw()  # Hide main window
 
@@ -53,6 +57,9 @@ def export_config(config: dict, current_config_path: str):
         current_config_path (str): Path of the currently loaded config file.
     """
 
+    import tkinter as tk # Only imported when a dialog is actually opened
+    from tkinter import filedialog
+
     # Make sure Tk doesn't show the main window
     root = tk.Tk()
     root.withdraw()
@@ -78,37 +85,298 @@ def export_config(config: dict, current_config_path: str):
     else:
         print("Export canceled.")
 
+class SequenceAllocator:
+    """
+    Allocates numbered output paths ('frame_000001.png') per (directory, stem, suffix).
+
+    Each directory is scanned once, after that ids are handed out in O(1). Ids are
+    reserved at allocation time, so concurrent writer threads never get the same path.
+    If an allocated path already exists (written by something outside this process)
+    the directory is rescanned and numbering continues after the highest id found.
+    """
+    def __init__(self):
+        self._next_ids = {}  # (directory, stem, suffix) -> next free id
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scan(parent_dir, stem, suffix):
+        pattern = re.compile(rf"^{re.escape(stem)}_(\d{{6}}){re.escape(suffix)}$")
+        existing_ids = []
+        for file in parent_dir.glob(f"{stem}_*{suffix}"):
+            match = pattern.match(file.name)
+            if match:
+                existing_ids.append(int(match.group(1)))
+        return max(existing_ids, default=-1) + 1
+
+    def next_path(self, base_path):
+        base_path = Path(base_path)
+        parent_dir = base_path.parent
+        stem = base_path.stem  # 'frame'
+        suffix = base_path.suffix  # '.png'
+        key = (os.path.abspath(parent_dir), stem, suffix)
+
+        with self._lock:
+            next_id = self._next_ids.get(key)
+            if next_id is None:
+                next_id = self._scan(parent_dir, stem, suffix)
+            path = parent_dir / f"{stem}_{next_id:06d}{suffix}"
+            if path.exists():
+                # Files appeared from outside, continue after the highest id on disk
+                next_id = max(next_id + 1, self._scan(parent_dir, stem, suffix))
+                path = parent_dir / f"{stem}_{next_id:06d}{suffix}"
+            self._next_ids[key] = next_id + 1
+        return str(path)
+
+    def reset(self, base_path=None):
+        """Forget cached ids (for one base path, or all), forcing a rescan on next use."""
+        with self._lock:
+            if base_path is None:
+                self._next_ids.clear()
+                return
+            base_path = Path(base_path)
+            self._next_ids.pop((os.path.abspath(base_path.parent), base_path.stem, base_path.suffix), None)
+
+_sequence_allocator = SequenceAllocator()
+
 def get_unique_output_path(base_path):
     """
     Given a path like 'output/frame.png', returns a path like 'output/frame_000001.png'
     based on how many existing files match 'frame_######.png' in the directory.
+    The directory is only scanned on first use, see SequenceAllocator.
+    """
+    return _sequence_allocator.next_path(base_path)
+
+FRAME_STACK_HEADER = 128  # Bytes reserved for the .npy header, so the frame count can be patched in afterwards
+
+def frame_stack_header(shape, dtype):
+    """
+    .npy (version 1.0) header for a C-ordered array of shape, padded to FRAME_STACK_HEADER
+    bytes so it can be rewritten in place once the final frame count is known.
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.lib.format.dtype_to_descr(np.dtype(dtype)), tuple(shape))
+    size = FRAME_STACK_HEADER - 10  # Magic string, version and header length
+    if len(header) + 1 > size:
+        raise ValueError(f"Frame stack header too long for shape {shape}")
+    return b"\x93NUMPY\x01\x00" + size.to_bytes(2, "little") + header.ljust(size - 1).encode("latin1") + b"\n"
+
+def open_frame_stack(path):
+    """Memory-map a raw frame stack (.npy of N x H x W [x C]) read-only, frames are zero-copy views."""
+    frames = np.load(path, mmap_mode="r")
+    if frames.ndim not in {3, 4}:
+        raise ValueError(f"Frame stack must be N x H x W [x C], got shape {frames.shape}: {path}")
+    return frames
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
+
+def _natural_key(path):
+    # 'frame_2.png' before 'frame_10.png', zero padded names sort the same either way
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", path)]
+
+def list_image_sequence(pattern, start=0, end=None, step=1):
+    """
+    Sorted image paths of a folder or a glob pattern ('shots/frame_*.png'), sliced by
+    start/end/step (indices into the sorted list, end exclusive).
+    """
+    if os.path.isdir(pattern):
+        paths = [join(pattern, name) for name in os.listdir(pattern)
+                 if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS]
+    else:
+        paths = glob.glob(pattern)
+    paths = sorted(paths, key=_natural_key)[start:end:step]
+    if not paths:
+        raise FileNotFoundError(f"No images found for: {pattern}")
+    return paths
+
+class ImageSequenceReader:
     """
-    base_path = Path(base_path)
-    parent_dir = base_path.parent
-    stem = base_path.stem  # 'frame'
-    suffix = base_path.suffix  # '.png'
+    Decodes an image sequence ahead of the reader on a small thread pool (cv2.imread
+    releases the GIL). Up to prefetch decodes are in flight, kept in a queue in sequence
+    order, so frames come out in order however the decodes finish. With loop=True the
+    sequence starts over after the last image.
+    """
+    def __init__(self, paths, workers=2, prefetch=8, loop=False):
+        self.paths = paths
+        self.loop = loop
+        self.prefetch = max(1, int(prefetch))
+        self.pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="sequence")
+        self.pending = deque()  # (index, future) in sequence order
+        self.next_index = 0     # Next index to submit
+        self.decoded = 0
+        self.failed = 0
+        self._failed_in_row = 0 # A whole pass of failures ends a looping sequence
+        self._fill()
+
+    def _fill(self):
+        while len(self.pending) < self.prefetch:
+            if self.next_index >= len(self.paths):
+                if not self.loop:
+                    return
+                self.next_index = 0
+            path = self.paths[self.next_index]
+            self.pending.append((self.next_index, self.pool.submit(cv2.imread, path)))
+            self.next_index += 1
+
+    def skip(self, count):
+        """Drop the next count frames (late frames), decodes still queued are cancelled. Returns how many were dropped."""
+        dropped = 0
+        while dropped < count and self.pending:
+            self.pending.popleft()[1].cancel()
+            dropped += 1
+        self._fill()
+        return dropped
+
+    def read(self):
+        """Next frame in sequence order, None at the end (unreadable images are skipped)."""
+        while self.pending:
+            index, future = self.pending.popleft()
+            self._fill()
+            frame = future.result()
+            if frame is not None:
+                self.decoded += 1
+                self._failed_in_row = 0
+                return frame
+            self.failed += 1
+            self._failed_in_row += 1
+            print(f"[Warning] Failed to read image: {self.paths[index]}")
+            if self._failed_in_row >= len(self.paths):
+                print("[Warning] No image of the sequence could be read, stopping")
+                self.release()
+        return None
+
+    def is_open(self):
+        return bool(self.pending)
 
-    pattern = re.compile(rf"^{re.escape(stem)}_(\d{{6}}){re.escape(suffix)}$")
-    existing_ids = []
-    for file in parent_dir.glob(f"{stem}_*{suffix}"):
-        match = pattern.match(file.name)
-        if match:
-            existing_ids.append(int(match.group(1)))
-    next_id = max(existing_ids, default=-1) + 1
-    new_name = f"{stem}_{next_id:06d}{suffix}"
-    return str(parent_dir / new_name)
+    def stats(self):
+        return {"images": len(self.paths), "decoded": self.decoded, "failed": self.failed,
+                "prefetched": sum(future.done() for _, future in self.pending)}
 
-def open_input_stream(input_root, input_type, input_source, framerate=30):
-    return InputStreamWrapper(input_root, input_type, input_source, framerate)
+    def release(self):
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.pool.shutdown(wait=True)
+
+def open_input_stream(input_root, input_type, input_source, framerate=30, threaded=False, buffer_size=4, drop_late=True, sequence=None):
+    return InputStreamWrapper(input_root, input_type, input_source, framerate, threaded, buffer_size, drop_late, sequence)
+
+class FramePacer:
+    """
+    Paces frames against absolute deadlines (start + n / framerate) on perf_counter,
+    so sleep overshoot doesn't add up from frame to frame. wait() returns how many
+    whole frame intervals the caller is behind; those deadlines are skipped so the
+    stream catches up instead of playing slower than the source. The caller counts the
+    frames it actually drops in skipped.
+    """
+    LATE_TOLERANCE = 0.001  # Seconds past the deadline before a frame counts as late
+
+    def __init__(self, framerate, window=120):
+        self.interval = 1.0 / framerate
+        self.next_deadline = None
+        self.lateness = deque(maxlen=window)  # Seconds after the deadline each frame was released
+        self.frames = 0
+        self.late = 0
+        self.skipped = 0
+
+    def wait(self):
+        now = time.perf_counter()
+        if self.next_deadline is None:
+            self.next_deadline = now
+        elif now < self.next_deadline:
+            time.sleep(self.next_deadline - now)
+            now = time.perf_counter()
+        lateness = now - self.next_deadline
+        behind = int(lateness // self.interval) if lateness >= self.interval else 0
+        self.next_deadline += self.interval * (1 + behind)
+        self.lateness.append(lateness)
+        self.frames += 1
+        if lateness > self.LATE_TOLERANCE:
+            self.late += 1
+        return behind
+
+    def stats(self):
+        lateness = sorted(self.lateness)
+        mean = sum(lateness) / len(lateness) if lateness else 0.0
+        jitter = (sum((v - mean) ** 2 for v in lateness) / len(lateness)) ** 0.5 if lateness else 0.0
+        return {"paced": self.frames, "late": self.late, "skipped": self.skipped,
+                "jitter_ms": round(jitter * 1000, 3), "mean_late_ms": round(mean * 1000, 3),
+                "max_late_ms": round(lateness[-1] * 1000, 3) if lateness else 0.0}
+
+class FrameRingBuffer:
+    """
+    Bounded frame buffer shared between a capture thread and the pipeline loop.
+
+    Policies:
+        "latest": Latest frame wins. When full the oldest frame is dropped, and get()
+                  discards everything but the newest frame (live feeds).
+        "block":  Never drop. put() waits for free space (video files).
+    """
+    def __init__(self, capacity=4, policy="latest"):
+        if policy not in {"latest", "block"}:
+            raise ValueError(f"Unknown buffer policy: {policy}")
+        self.capacity = max(1, int(capacity))
+        self.policy = policy
+        self.frames = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        # Counters
+        self.captured = 0
+        self.dropped = 0
+        self.consumed = 0
+
+    def put(self, frame):
+        """Add a frame. Returns False if the buffer was closed."""
+        with self.cond:
+            if self.policy == "block":
+                while len(self.frames) >= self.capacity and not self.closed:
+                    self.cond.wait()
+            if self.closed:
+                return False
+            if len(self.frames) >= self.capacity:
+                self.frames.popleft()
+                self.dropped += 1
+            self.frames.append(frame)
+            self.captured += 1
+            self.cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Wait for the next frame. Returns None once closed and drained (or on timeout)."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.frames or self.closed, timeout):
+                return None
+            if not self.frames:
+                return None
+            if self.policy == "latest":
+                self.dropped += len(self.frames) - 1
+                frame = self.frames.pop()
+                self.frames.clear()
+            else:
+                frame = self.frames.popleft()
+            self.consumed += 1
+            self.cond.notify_all()
+            return frame
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {"captured": self.captured, "dropped": self.dropped,
+                    "consumed": self.consumed, "buffered": len(self.frames)}
 
 class InputStreamWrapper:
-    def __init__(self, input_root, input_type, input_source, framerate=30):
+    def __init__(self, input_root, input_type, input_source, framerate=30, threaded=False, buffer_size=4, drop_late=True, sequence=None):
         self.root = input_root
         self.input_type = input_type
         self.input_source = input_source
         self.framerate = framerate
-        self.delay = 1.0 / framerate if framerate != 0 else 0
-        self.last_frame_time = time.time()
+        self.pacer = FramePacer(framerate) if framerate else None
+        # Video files, frame stacks and image sequences skip the frames the pipeline fell behind on
+        self.drop_late = drop_late and input_type in {"video", "frame_stack", "image_sequence"}
+        self.threaded = threaded and input_type in {"video", "live"}
+        self.buffer = None
 
         if input_type == "image":
             self.input_source = join(input_root,input_source)
@@ -119,6 +387,24 @@ class InputStreamWrapper:
                 raise ValueError(f"Failed to read image: {self.input_source}")
             self.finished = False
 
+        elif input_type == "frame_stack":
+            # Raw frames recorded with FrameStackRecorder, replayed without decoding.
+            # Frames are read-only views of the file, copy before drawing on them.
+            self.input_source = join(input_root,input_source)
+            if not os.path.exists(self.input_source):
+                raise FileNotFoundError(f"Frame stack not found: {self.input_source}")
+            self.frames = open_frame_stack(self.input_source)
+            self.index = 0
+
+        elif input_type == "image_sequence":
+            # input_source is a folder or a glob pattern, sequence holds
+            # start/end/step (into the sorted file list), loop, workers and prefetch
+            sequence = sequence or {}
+            self.input_source = join(input_root,input_source)
+            paths = list_image_sequence(self.input_source, sequence.get("start", 0), sequence.get("end"), sequence.get("step", 1))
+            self.sequence = ImageSequenceReader(paths, workers=sequence.get("workers", 2),
+                                                prefetch=sequence.get("prefetch", 8), loop=sequence.get("loop", False))
+
         elif input_type in {"video", "live"}:
             if input_type == "live":
                 print("Opening live feed...")
@@ -135,6 +421,22 @@ class InputStreamWrapper:
         else:
             raise ValueError(f"Unknown input type: {input_type}")
 
+        if self.threaded:
+            # Decode on a background thread so capture overlaps with processing
+            policy = "latest" if input_type == "live" else "block"
+            self.buffer = FrameRingBuffer(buffer_size, policy)
+            self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self._capture_thread.start()
+
+    def _capture_loop(self):
+        while not self.buffer.closed:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            if not self.buffer.put(frame):
+                break
+        self.buffer.close()
+
     def read(self):
         if self.input_type == "image":
             if self.finished:
@@ -143,20 +445,66 @@ class InputStreamWrapper:
             return self.frame
 
         # For video/live, throttle by framerate
-        now = time.time()
-        elapsed = now - self.last_frame_time
-        if elapsed < self.delay:
-            time.sleep(self.delay - elapsed)
-        self.last_frame_time = time.time()
+        behind = self.pacer.wait() if self.pacer is not None else 0
+        if not self.drop_late:
+            behind = 0
 
+        if self.input_type == "frame_stack":
+            behind = min(behind, max(0, len(self.frames) - self.index))
+            self.index += behind
+            self._count_skipped(behind)
+            if self.index >= len(self.frames):
+                return None
+            frame = self.frames[self.index]
+            self.index += 1
+            return frame
+
+        if self.input_type == "image_sequence":
+            self._count_skipped(self.sequence.skip(behind))
+            return self.sequence.read()
+
+        if self.threaded:
+            # Already decoded, dropping them just keeps the timeline
+            for _ in range(behind):
+                if self.buffer.get() is None:
+                    return None
+                self._count_skipped(1)
+            return self.buffer.get()
+
+        for _ in range(behind):
+            if not self.cap.grab():
+                return None
+            self._count_skipped(1)
         ret, frame = self.cap.read()
         return frame if ret else None
 
+    def _count_skipped(self, count):
+        if self.pacer is not None:
+            self.pacer.skipped += count
+
+    def stats(self):
+        """Captured/dropped/consumed frame counters (threaded capture) and pacing stats."""
+        stats = self.buffer.stats() if self.buffer is not None else {}
+        if self.input_type == "image_sequence":
+            stats.update(self.sequence.stats())
+        if self.pacer is not None:
+            stats.update(self.pacer.stats())
+        return stats
+
     def release(self):
+        if self.input_type == "image_sequence":
+            self.sequence.release()
         if self.input_type in {"video", "live"}:
+            if self.threaded:
+                self.buffer.close()
+                self._capture_thread.join()
             self.cap.release()
 
     def is_open(self):
         if self.input_type == "image":
             return not self.finished
+        if self.input_type == "frame_stack":
+            return self.index < len(self.frames)
+        if self.input_type == "image_sequence":
+            return self.sequence.is_open()
         return self.cap.isOpened()
@@ -1,52 +1,228 @@
 # utils/profiler.py
+import os
+import json
 import time
+import threading
 from collections import deque
+import numpy as np
+
+class RollingStats:
+    """
+    Fixed-size numpy ring buffer of the most recent values with an O(1) running sum,
+    so the mean is free to read. Percentiles and the window max are computed on demand.
+    total/count cover every value pushed since creation.
+    """
+    def __init__(self, capacity=30):
+        self.values = np.zeros(max(1, int(capacity)), dtype=np.float64)
+        self.size = 0
+        self.index = 0
+        self.window_sum = 0.0
+        self.total = 0.0
+        self.count = 0
+        self.peak = 0.0  # All-time max
+
+    def push(self, value):
+        if self.size == len(self.values):
+            self.window_sum -= self.values[self.index]
+        else:
+            self.size += 1
+        self.values[self.index] = value
+        self.index = (self.index + 1) % len(self.values)
+        self.window_sum += value
+        self.total += value
+        self.count += 1
+        if value > self.peak:
+            self.peak = value
+
+    def window(self):
+        return self.values[:self.size]
+
+    def mean(self):
+        return float(self.window_sum / self.size) if self.size else 0.0
+
+    def last(self):
+        return float(self.values[self.index - 1]) if self.size else 0.0
+
+    def percentiles(self, q=(50, 95, 99)):
+        if not self.size:
+            return [0.0] * len(q)
+        return [float(v) for v in np.percentile(self.window(), q)]
+
+    def max(self):
+        return float(self.window().max()) if self.size else 0.0
+
+    def summary(self):
+        p50, p95, p99 = self.percentiles()
+        return {"mean": self.mean(), "p50": p50, "p95": p95, "p99": p99, "max": self.max(),
+                "count": self.count, "peak": self.peak}
 
 class PipelineProfiler:
-    def __init__(self, window_size=30, print_interval=10,desired_framerate=0):
+    """
+    Frame and step timer. Keeps the last window_size frame/step times in RollingStats and
+    prints mean and p50/p95/p99/max every print_interval frames. With desired_framerate set,
+    frames longer than 1/desired_framerate are counted as over budget.
+
+    With trace=True every frame and step is also kept as a Chrome trace event (the last
+    max_trace_events of them), export_trace() writes them as JSON for chrome://tracing or Perfetto.
+    """
+    def __init__(self, window_size=30, print_interval=10,desired_framerate=0, trace=False, max_trace_events=200000):
         self.window_size = window_size
         self.print_interval = print_interval
         self.desired_framerate = desired_framerate
-        self.step_times = {}  # step_name -> deque of recent times
-        self.frame_times = deque(maxlen=window_size)
+        self.budget = 1.0 / desired_framerate if desired_framerate else 0
+        self.step_times = {}  # step_name -> RollingStats of recent times
+        self.frame_times = RollingStats(window_size)
+        self.metrics = {}  # metric_name -> RollingStats of recent values (may be recorded from other threads)
         self.frame_count = 0
+        self.over_budget = 0
+        self._lock = threading.Lock()
+        self.trace = trace
+        self.trace_events = deque(maxlen=max_trace_events)
+        self._epoch = time.perf_counter()
+
+    def _trace_span(self, name, cat, start, end):
+        self.trace_events.append({"name": name, "cat": cat, "ph": "X", "pid": os.getpid(),
+                                  "tid": threading.get_ident(), "ts": (start - self._epoch) * 1e6,
+                                  "dur": (end - start) * 1e6, "args": {"frame": self.frame_count}})
 
     def start_frame(self):
         self._frame_start = time.perf_counter()
 
     def end_frame(self):
-        total_time = time.perf_counter() - self._frame_start
-        self.frame_times.append(total_time)
-        self.frame_count += 1
+        end = time.perf_counter()
+        total_time = end - self._frame_start
+        if self.trace:
+            self._trace_span("Frame", "frame", self._frame_start, end)
+        self._count_frame(total_time)
 
         if self.frame_count % self.print_interval == 0 or self.frame_count == self.window_size:
             self._print_summary()
 
+    def _count_frame(self, total_time):
+        self.frame_times.push(total_time)
+        self.frame_count += 1
+        if self.budget and total_time > self.budget:
+            self.over_budget += 1
+
     def start_step(self, step_name):
         self._step_start = time.perf_counter()
         self._current_step = step_name
 
     def end_step(self):
-        elapsed = time.perf_counter() - self._step_start
-        dq = self.step_times.setdefault(self._current_step, deque(maxlen=self.window_size))
-        dq.append(elapsed)
+        end = time.perf_counter()
+        elapsed = end - self._step_start
+        if self.trace:
+            self._trace_span(self._current_step, "step", self._step_start, end)
+        self._step_stats(self._current_step).push(elapsed)
 
-    def _moving_avg(self, dq):
-        return sum(dq) / len(dq) if dq else 0.0
+    def _step_stats(self, name):
+        stats = self.step_times.get(name)
+        if stats is None:
+            stats = self.step_times[name] = RollingStats(self.window_size)
+        return stats
+
+    def record(self, name, value):
+        """Record an auxiliary metric (queue depth, latency, ...) shown in the summary."""
+        with self._lock:
+            stats = self.metrics.get(name)
+            if stats is None:
+                stats = self.metrics[name] = RollingStats(self.window_size)
+            stats.push(value)
+            if self.trace:
+                self.trace_events.append({"name": name, "ph": "C", "pid": os.getpid(),
+                                          "ts": (time.perf_counter() - self._epoch) * 1e6, "args": {"value": value}})
+
+    def add_frame(self, total_time, step_times=None):
+        """Account for a frame that was timed elsewhere (e.g. in a worker process)."""
+        self._count_frame(total_time)
+        for name, elapsed in (step_times or {}).items():
+            self._step_stats(name).push(elapsed)
+
+    def take_step_times(self):
+        """Total time per step since the last call, then start over."""
+        times = {name: stats.total for name, stats in self.step_times.items()}
+        self.step_times = {}
+        return times
+
+    def print_throughput(self, wall_time):
+        """Final summary for batch runs: frames over wall time, plus the usual per-step stats."""
+        fps = self.frame_count / wall_time if wall_time > 0 else 0
+        print(f"[Throughput] Frames: {self.frame_count} | Wall: {wall_time:.2f} s ({fps:.1f} FPS)")
+        self._print_summary()
+
+    def summary(self):
+        """Frame, step and metric stats of the current window (times in seconds)."""
+        with self._lock:
+            metrics = {name: stats.summary() for name, stats in self.metrics.items()}
+        return {"frames": self.frame_count, "over_budget": self.over_budget,
+                "frame": self.frame_times.summary(),
+                "steps": {name: stats.summary() for name, stats in self.step_times.items()},
+                "metrics": metrics}
+
+    def export_trace(self, path):
+        """Write the recorded trace events as Chrome trace-event JSON."""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": list(self.trace_events), "displayTimeUnit": "ms"}, f)
+        print(f"[Profiler] Wrote {len(self.trace_events)} trace events to '{path}'")
 
     def _print_summary(self):
         print_str = ""
-        avg_frame_time = self._moving_avg(self.frame_times)
+        avg_frame_time = self.frame_times.mean()
         fps = 1.0 / avg_frame_time if avg_frame_time > 0 else 0
-        
+        p50, p95, p99 = self.frame_times.percentiles()
+
         step_summaries = [
-            f"{name}: {self._moving_avg(times)*1000:.2f} ms"
-            for name, times in self.step_times.items()
+            f"{name}: {stats.mean()*1000:.2f} ms (p95 {stats.percentiles((95,))[0]*1000:.2f})"
+            for name, stats in self.step_times.items()
         ]
         step_summary_str = " | ".join(step_summaries)
+        with self._lock:
+            metric_summaries = [
+                f"{name}: {stats.mean():.1f}"
+                for name, stats in self.metrics.items()
+            ]
+        if metric_summaries:
+            step_summary_str += " || " + " | ".join(metric_summaries)
 
         warning = "[!]" if fps < self.desired_framerate else ""
+        budget_str = f" | Over budget: {self.over_budget}/{self.frame_count}" if self.budget else ""
         print_str += f"\n{warning}[Frames: {self.frame_count}] "
-        print_str +=  f"Avg: {avg_frame_time*1000:.2f} ms/frame ({fps:.1f} FPS) | {step_summary_str}"
+        print_str +=  f"Avg: {avg_frame_time*1000:.2f} ms/frame ({fps:.1f} FPS) | "
+        print_str +=  f"p50 {p50*1000:.2f} / p95 {p95*1000:.2f} / p99 {p99*1000:.2f} / max {self.frame_times.max()*1000:.2f} ms{budget_str}\n"
+        print_str +=  f"  {step_summary_str}"
 
         print(print_str, end="\n", flush=True)
+
+class StartupReport:
+    """
+    Splits time-to-first-frame into phases. mark(phase) books the time since the previous
+    mark to phase, move() rebooks time measured inside one phase (lazy imports, asset loads)
+    to another.
+    """
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self._last = self.start
+        self.phases = {}  # phase -> seconds, in the order they were first marked
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def move(self, seconds, source, target):
+        seconds = min(seconds, self.phases.get(source, 0.0))
+        self.phases[source] = self.phases.get(source, 0.0) - seconds
+        self.phases[target] = self.phases.get(target, 0.0) + seconds
+
+    def total(self):
+        return self._last - self.start
+
+    def print(self):
+        total = self.total()
+        print(f"=====\n[Startup] Time to first frame: {total*1000:.1f} ms")
+        for phase, seconds in self.phases.items():
+            share = seconds / total * 100 if total > 0 else 0
+            print(f"[Startup] {phase.rjust(18)}: {seconds*1000:8.1f} ms ({share:4.1f}%)")
+        print("=====")
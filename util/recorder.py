@@ -0,0 +1,167 @@
+# util/recorder.py
+import os
+import time
+import queue
+import threading
+from os.path import dirname
+import cv2
+import numpy as np
+from util.io import frame_stack_header
+
+class VideoRecorder:
+    """
+    Native recording sink. Frames handed to submit() are copied onto a bounded queue
+    and encoded by a background thread with cv2.VideoWriter, so encoding never runs on
+    the render thread. The writer is opened on the first frame, later frames of a
+    different size are resized to match.
+
+    Policies (when the queue is full):
+        "block": submit() waits for a free slot (no frames lost, may slow the render loop).
+        "drop":  the frame is discarded and counted in self.dropped.
+    """
+    def __init__(self, codec="mp4v", fps=30, max_queue=64, policy="drop", profiler=None, verbose=True):
+        if policy not in {"block", "drop"}:
+            raise ValueError(f"Unknown recorder policy: {policy}")
+        self.codec = codec
+        self.fps = fps
+        self.policy = policy
+        self.profiler = profiler
+        self.verbose = verbose
+        self.max_queue = max(1, int(max_queue))
+        self.path = None
+        self.queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def recording(self):
+        return self._thread is not None
+
+    def reset_stats(self):
+        with self._lock:
+            self.written = 0
+            self.dropped = 0
+            self.failed = False
+
+    def start(self, path):
+        if self.recording:
+            return
+        self.path = str(path)
+        if dirname(self.path):
+            os.makedirs(dirname(self.path), exist_ok=True)
+        self.reset_stats()
+        self.queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = threading.Thread(target=self._encode_loop, args=(self.path, self.queue), daemon=True)
+        self._thread.start()
+        if self.verbose: print(f"[Recorder] Recording to '{self.path}' ({self._describe()})")
+
+    def _describe(self):
+        return f"{self.codec}, {self.fps} FPS"
+
+    def stop(self):
+        """Encode the frames still queued, then close the file."""
+        if not self.recording:
+            return
+        self.queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self.verbose: print(f"[Recorder] Stopped '{self.path}': {self.stats()}")
+
+    def toggle(self, path):
+        if self.recording:
+            self.stop()
+        else:
+            self.start(path)
+        return self.recording
+
+    def submit(self, frame):
+        """Queue a copy of frame for encoding. Returns False if it was dropped (or not recording)."""
+        if not self.recording:
+            return False
+        item = (frame.copy(), time.perf_counter())
+        try:
+            if self.policy == "block":
+                self.queue.put(item)
+            else:
+                self.queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        if self.profiler is not None:
+            self.profiler.record("Record queue", self.queue.qsize())
+        return True
+
+    def _encode_loop(self, path, frames):
+        writer = None
+        size = None
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            frame, submitted = item
+            if writer is None:
+                size = (frame.shape[1], frame.shape[0])
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.codec), self.fps, size, True)
+                if not writer.isOpened():
+                    print(f"[Warning] Failed to open video writer for: {path} (codec '{self.codec}')")
+                    with self._lock:
+                        self.failed = True
+            if self.failed:
+                continue  # Keep draining so submit() never blocks forever
+            if frame.ndim == 2:
+                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            if (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size)
+            writer.write(frame)
+            with self._lock:
+                self.written += 1
+            if self.profiler is not None:
+                self.profiler.record("Record lag ms", (time.perf_counter() - submitted) * 1000)
+        if writer is not None:
+            writer.release()
+
+    def stats(self):
+        with self._lock:
+            return {"written": self.written, "dropped": self.dropped, "failed": self.failed,
+                    "queued": self.queue.qsize() if self.queue is not None else 0}
+
+class FrameStackRecorder(VideoRecorder):
+    """
+    Dumps frames uncompressed to a .npy frame stack (N x H x W [x C]) for replay with the
+    "frame_stack" input type. Same queue, thread and policies as VideoRecorder, but frames
+    are written as raw bytes, and the header is patched with the frame count on stop().
+    The first frame fixes shape and dtype, later frames are converted/resized to match.
+    """
+    def __init__(self, max_queue=64, policy="drop", profiler=None, verbose=True):
+        super().__init__(codec="npy", fps=0, max_queue=max_queue, policy=policy, profiler=profiler, verbose=verbose)
+
+    def _describe(self):
+        return "raw frames"
+
+    def _encode_loop(self, path, frames):
+        shape = None
+        with open(path, "wb") as f:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                frame, submitted = item
+                if shape is None:
+                    shape, dtype = frame.shape, frame.dtype
+                    f.write(frame_stack_header((0,) + shape, dtype))
+                if frame.ndim != len(shape):
+                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR if frame.ndim == 2 else cv2.COLOR_BGR2GRAY)
+                if frame.shape[:2] != shape[:2]:
+                    frame = cv2.resize(frame, (shape[1], shape[0]))
+                f.write(np.ascontiguousarray(frame, dtype=dtype).data)
+                with self._lock:
+                    self.written += 1
+                if self.profiler is not None:
+                    self.profiler.record("Record lag ms", (time.perf_counter() - submitted) * 1000)
+            if shape is not None:
+                f.seek(0)
+                f.write(frame_stack_header((self.written,) + shape, dtype))
+        if shape is None:
+            os.remove(path)  # Nothing recorded, don't leave an unreadable file behind
@@ -0,0 +1,99 @@
+# util/writer.py
+import os
+import time
+import queue
+import threading
+from os.path import dirname
+import cv2
+
+class OutputWriter:
+    """
+    Background image writer. Frames are copied on submit() and encoded/written
+    by worker threads, so cv2.imwrite never runs on the render thread.
+
+    Policies (when the queue is full):
+        "block": submit() waits for a free slot (backpressure).
+        "drop":  the frame is discarded and counted in self.dropped.
+    """
+    def __init__(self, workers=2, max_queue=32, policy="block", profiler=None, verbose=True):
+        if policy not in {"block", "drop"}:
+            raise ValueError(f"Unknown writer policy: {policy}")
+        self.policy = policy
+        self.profiler = profiler
+        self.verbose = verbose
+        self.queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, int(workers)))]
+        for t in self._workers:
+            t.start()
+
+    def submit(self, path, frame, copy=True):
+        """Queue a frame to be written to path. Returns False if it was dropped."""
+        if self._closed:
+            raise RuntimeError("OutputWriter is closed")
+        item = (str(path), frame.copy() if copy else frame, time.perf_counter())
+        try:
+            if self.policy == "block":
+                self.queue.put(item)
+            else:
+                self.queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print(f"[Warning] Writer queue full, dropped '{path}'")
+            return False
+        if self.profiler is not None:
+            self.profiler.record("Writer queue", self.queue.qsize())
+        return True
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            path, frame, submitted = item
+            try:
+                if dirname(path):
+                    os.makedirs(dirname(path), exist_ok=True)
+                if self.verbose: print(f"[OUTPUT] Writing '{path}'")
+                success = cv2.imwrite(path, frame)
+                with self._lock:
+                    if success:
+                        self.written += 1
+                    else:
+                        self.failed += 1
+                if not success:
+                    print(f"[Warning] Failed to write output to: {path}")
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                print(f"[Warning] Exception while saving output to {path}: {e}")
+            finally:
+                if self.profiler is not None:
+                    self.profiler.record("Writer ms", (time.perf_counter() - submitted) * 1000)
+                self.queue.task_done()
+
+    def flush(self):
+        """Block until every queued frame has been written."""
+        self.queue.join()
+
+    def close(self):
+        """Flush pending writes and stop the worker threads."""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        for _ in self._workers:
+            self.queue.put(None)
+        for t in self._workers:
+            t.join()
+
+    def stats(self):
+        with self._lock:
+            return {"written": self.written, "failed": self.failed,
+                    "dropped": self.dropped, "queued": self.queue.qsize()}